@@ -1,20 +1,57 @@
+import os
+
 import dash
+import flask
 from dash import html, dcc
 from dash.dependencies import Input, Output
 
 import dash_bootstrap_components as dbc
 
+from src.backend.data.fetch_pipeline import revalidator
+from src.backend.data.shared_store import get_shared_store
+from src.backend.data.snapshot import import_snapshot_on_boot
+from src.backend.instrumentation import metrics, profile_capture
+
+# Seed the cache from a baked snapshot (if MACRO_SNAPSHOT is set) before the pages load their data. However the
+# server is started, files already in place are skipped (e.g. imported by the gunicorn master, see gunicorn.conf.py)
+import_snapshot_on_boot()
+
 from src.frontend.visualisation.components.navbar import navbar
-from src.frontend.visualisation.pages.management import page_dict
+from src.frontend.visualisation.pages import yield_curve
+from src.frontend.visualisation.pages.management import page_dict, preload_pages
 
 # Connect to main app.py file
 app = dash.Dash(__name__,
                 external_stylesheets=[dbc.themes.BOOTSTRAP],
                 meta_tags=[{"name": "viewport", "content": "width=device-width"}],
                 suppress_callback_exceptions=True)
+server = app.server
 
 pages = page_dict()
 
+
+def refresh_pages():
+    # Rebuild the page layouts (and bring the yield surface up to date) on their next visit
+    for page in pages.values():
+        page.layout.cache_clear()
+    yield_curve.refresh_yield_surface()
+
+
+# In the multi-worker serving mode (see gunicorn.conf.py) the datasets are read from the shared store,
+# refresh the pages whenever the loader publishes new data
+shared_store = get_shared_store()
+if shared_store is not None:
+    shared_store.add_listener(refresh_pages)
+
+# Pages may be built from older cached data while it is refreshed in the background, rebuild them once it is
+revalidator.add_listener(refresh_pages)
+
+# Page layouts are built on first visit, set MACRO_PRELOAD_PAGES to build them at startup instead
+# (e.g. before workers fork). Set MACRO_PROFILE_DIR to capture a cProfile + flamegraph of the build.
+if os.environ.get('MACRO_PRELOAD_PAGES') or os.environ.get('MACRO_PROFILE_DIR'):
+    with profile_capture(os.environ.get('MACRO_PROFILE_DIR'), name='startup'):
+        preload_pages(pages)
+
 # Define the index page layout
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
@@ -27,12 +64,21 @@ app.layout = html.Div([
 @app.callback(Output('page-content', 'children'),
               [Input('url', 'pathname')])
 def display_page(pathname):
+    if shared_store is not None:
+        shared_store.check_for_updates()
+
     if pathname in pages.keys():
-        return pages[pathname].layout
+        return pages[pathname].layout()
     else:
         return "404 Page Error! Please choose a link"
 
 
+# Expose timers and counters from the data, analysis and page layers
+@app.server.route('/metrics')
+def get_metrics():
+    return flask.jsonify(metrics.snapshot())
+
+
 # Run the app on localhost:8050
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,32 @@
+import os
+import threading
+
+import flask
+
+from src.backend.data.fetch_pipeline import revalidator
+from src.backend.export_api import export_api, get_projected_interest, precompute_rollups, rollup_cache
+from src.backend.instrumentation import metrics
+
+# Read-only data service exposing the backend datasets as CSV / JSON / Arrow, see src/backend/export_api.py
+server = flask.Flask(__name__)
+server.register_blueprint(export_api)
+
+# Frames derived from older cached data are rebuilt once a background refresh has replaced it (the datasets'
+# resampled views notice this themselves, see ResampleCache._needs_update)
+revalidator.add_listener(get_projected_interest.cache_clear)
+revalidator.add_listener(rollup_cache.clear)
+
+
+@server.route('/metrics')
+def get_metrics():
+    return flask.jsonify(metrics.snapshot())
+
+
+# Build the monthly / annual rollups in the background so the first aggregate requests are served from memory
+if os.environ.get('MACRO_PRECOMPUTE_ROLLUPS', '1') == '1':
+    threading.Thread(target=precompute_rollups, daemon=True).start()
+
+
+# Run the service on localhost:8051
+if __name__ == '__main__':
+    server.run(port=8051)
@@ -0,0 +1,44 @@
+import os
+import sys
+import subprocess
+
+"""
+Multi-worker serving mode:
+
+    MACRO_SHARED_STORE=/dev/shm/macro_economics gunicorn -c gunicorn.conf.py
+
+The master imports the snapshot at $MACRO_SNAPSHOT (if set) into the cache and publishes every dataset to the
+shared store before forking, then a loader process republishes them every MACRO_PUBLISH_INTERVAL seconds.
+Workers map the published datasets read-only instead of each loading their own copy, and rebuild their page
+layouts when a new publish is detected.
+
+"""
+
+os.environ.setdefault('MACRO_SHARED_STORE', '/dev/shm/macro_economics')
+
+wsgi_app = 'application:server'
+bind = os.environ.get('MACRO_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('MACRO_WORKERS', 4))
+
+_loader = None
+
+
+def on_starting(server):
+    global _loader
+    from src.backend.data.shared_store import SharedDatasetStore, publish_all
+    from src.backend.data.snapshot import import_snapshot_on_boot
+
+    # Seed the cache once, before anything is requested and before the workers fork
+    import_snapshot_on_boot()
+
+    # Publish once so workers never start without data, then keep it fresh from a separate process
+    publish_all(SharedDatasetStore(os.environ['MACRO_SHARED_STORE']))
+
+    interval = os.environ.get('MACRO_PUBLISH_INTERVAL', '3600')
+    _loader = subprocess.Popen([sys.executable, '-m', 'src.backend.data.shared_store', 'publish',
+                                '--watch', interval, '--skip-initial'])
+
+
+def on_exit(server):
+    if _loader is not None:
+        _loader.terminate()
@@ -1,6 +1,6 @@
-import matplotlib.pyplot as plt
 import pandas as pd
 
+from src.backend.data.bundle_loader import BundleLoader, DatasetRequest
 from src.backend.data.debt_column_matching import get_debt_matching_dict
 
 from src.backend.data.fiscaldata_treasury_gov. \
@@ -15,6 +15,9 @@ from src.backend.data.fiscaldata_treasury_gov. \
 from src.backend.data.home_treasury_gov. \
     daily_treasury_yield_curve import DailyTreasuryYieldCurve
 import datetime
+import functools
+
+from src.backend.instrumentation import metrics, timed
 
 """
 
@@ -48,36 +51,50 @@ class ProjectedInterest:
         self.iodo = InterestOnDebtOutstanding()
         self.sotso = SummaryOfTreasurySecuritiesOutstanding()
 
-        self.air_df = self.air.get_security_data_between_dates(start_date=self.start_date,
-                                                               end_date=self.end_date,
-                                                               security_desc=self.fiscaldata_desc)
-
-        self.dtyc_df = self.dtyc.get_all_data_between_dates(start_date=self.start_date,
-                                                            end_date=self.end_date)
-
-        self.iodo_df = self.iodo.get_expense_type_data_between_dates(start_date=self.start_date,
-                                                                     end_date=self.end_date,
-                                                                     expense_type_desc=self.fiscaldata_desc)
-
-        self.sotso_df = self.sotso.get_security_data_between_dates(start_date=self.start_date,
-                                                                   end_date=self.end_date,
-                                                                   security_desc=self.hometreasury_desc)
-
+        self.load_data()
         self.combine_data()
         self.interpolate_maturity()
         self.estimate_interest()
 
     # --- Analysis Steps
+    @timed('projected_interest.load_data')
+    def load_data(self):
+        loader = BundleLoader([DatasetRequest(name='air', dataset=self.air,
+                                              start_date=self.start_date, end_date=self.end_date,
+                                              search_column='security_desc', search_str=self.fiscaldata_desc),
+                               # Month end yields line up with the monthly datasets without reading daily data
+                               DatasetRequest(name='dtyc', dataset=self.dtyc,
+                                              start_date=self.start_date, end_date=self.end_date,
+                                              freq='monthly', agg='last'),
+                               DatasetRequest(name='iodo', dataset=self.iodo,
+                                              start_date=self.start_date, end_date=self.end_date,
+                                              transform=functools.partial(self.iodo.flatten_expense_type,
+                                                                          expense_type_desc=self.fiscaldata_desc)),
+                               DatasetRequest(name='sotso', dataset=self.sotso,
+                                              start_date=self.start_date, end_date=self.end_date,
+                                              search_column='security_class_desc',
+                                              search_str=self.hometreasury_desc)])
+        frames = loader.load()
+
+        self.air_df = frames['air']
+        self.dtyc_df = frames['dtyc']
+        self.iodo_df = frames['iodo']
+        self.sotso_df = frames['sotso']
+
+    @timed('projected_interest.combine_data')
     def combine_data(self):
         self.df = pd.merge(self.air_df, self.sotso_df, on='date', how='outer')
         self.df = pd.merge(self.df, self.dtyc_df, on='date', how='outer')
         self.df = pd.merge(self.df, self.iodo_df, on='date', how='outer')
         self.df = self.df.sort_values(by='date').reset_index(drop=True)
+        metrics.increment('projected_interest.combine_data.rows', len(self.df))
 
+    @timed('projected_interest.interpolate_maturity')
     def interpolate_maturity(self):
         for maturity in ['3 Mo', '6 Mo', '1 Yr', '2 Yr', '3 Yr', '5 Yr', '7 Yr', '10 Yr', '20 Yr', '30 Yr']:
             self.df[maturity] = self.df[maturity].interpolate(limit=1)
 
+    @timed('projected_interest.estimate_interest')
     def estimate_interest(self):
         _df = self.df[(self.df['date'] > datetime.datetime(year=2002, month=2, day=15)) &
                       (self.df['date'] < datetime.datetime(year=2002, month=3, day=15))]
@@ -88,6 +105,8 @@ class ProjectedInterest:
         plot_df = self.df[~self.df['month_expense_amt'].isna()]
         plot_df = plot_df[['date', 'est_interest', 'month_expense_amt']]
         if plot:
+            import matplotlib.pyplot as plt
+
             fig, ax = plt.subplots(1, 2, figsize=(10, 10))
 
             fig.suptitle(f'Estimated vs Actual Interest - {self.debt_type}', fontsize=16)
@@ -0,0 +1,118 @@
+import datetime
+
+import pandas as pd
+
+from src.backend.data.bundle_loader import BundleLoader, DatasetRequest
+from src.backend.data.debt_column_matching import get_debt_matching_dict
+
+from src.backend.data.fiscaldata_treasury_gov. \
+    avg_interest_rates import AvgInterestRates
+
+from src.backend.data.fiscaldata_treasury_gov. \
+    summary_of_treasury_securities_outstanding import SummaryOfTreasurySecuritiesOutstanding
+
+from src.backend.data.fiscaldata_treasury_gov. \
+    interest_on_debt_outstanding import InterestOnDebtOutstanding
+
+from src.backend.instrumentation import metrics, timed
+
+
+class ProjectedInterestBatch:
+    """
+    Estimated vs actual interest for every security type in get_debt_matching_dict() in one pass.
+
+    Each dataset is loaded once for all types, the security descriptions are mapped to a 'debt_type' column and
+    the estimate (avg_interest_rate_amt * total_mil_amt / 12) and error metrics are computed with vectorized
+    groupby operations. Types missing from any of the three datasets are skipped.
+
+    The result is a tidy frame with one row per (debt_type, date):
+
+        debt_type, date, est_interest, month_expense_amt, error, pct_error, cum_est_interest, cum_month_expense_amt
+
+    """
+
+    def __init__(self, start_date=datetime.datetime(year=2001, month=1, day=1), end_date=None):
+        self.start_date = start_date
+        self.end_date = datetime.datetime.today() if end_date is None else end_date
+
+        self.debt_match = get_debt_matching_dict()
+
+        self.air = AvgInterestRates()
+        self.iodo = InterestOnDebtOutstanding()
+        self.sotso = SummaryOfTreasurySecuritiesOutstanding()
+
+        self.load_data()
+        self.df = self.estimate_interest()
+
+    @timed('projected_interest_batch.load_data')
+    def load_data(self):
+        loader = BundleLoader([DatasetRequest(name='air', dataset=self.air,
+                                              start_date=self.start_date, end_date=self.end_date),
+                               DatasetRequest(name='iodo', dataset=self.iodo,
+                                              start_date=self.start_date, end_date=self.end_date),
+                               DatasetRequest(name='sotso', dataset=self.sotso,
+                                              start_date=self.start_date, end_date=self.end_date)])
+        frames = loader.load()
+
+        self.air_df = self._map_debt_type(frames['air'], column='security_desc', source='fiscaldata')
+        self.iodo_df = self._map_debt_type(frames['iodo'], column='expense_type_desc', source='fiscaldata')
+        self.sotso_df = self._map_debt_type(frames['sotso'], column='security_class_desc', source='hometreasury')
+
+    @timed('projected_interest_batch.estimate_interest')
+    def estimate_interest(self):
+        keys = ['debt_type', 'date']
+
+        # As in InterestOnDebtOutstanding.flatten_expense_type, each expense type must be listed under one
+        # category, otherwise summing over the categories below would count it more than once
+        n_categories = self.iodo_df.groupby('debt_type')['expense_catg_desc'].nunique()
+        assert (n_categories <= 1).all(), \
+            f'Expense types listed under several categories: {", ".join(n_categories[n_categories > 1].index)}'
+
+        air_df = self.air_df.groupby(keys, observed=True)[['avg_interest_rate_amt']].mean()
+        sotso_df = self.sotso_df.groupby(keys, observed=True)[['total_mil_amt']].sum()
+        iodo_df = self.iodo_df.groupby(keys, observed=True)[['month_expense_amt']].sum()
+
+        df = air_df.join(sotso_df, how='inner').join(iodo_df, how='inner').reset_index()
+        df = df.sort_values(by=keys).reset_index(drop=True)
+
+        df['est_interest'] = df['avg_interest_rate_amt'] * df['total_mil_amt'] / 12
+        df['error'] = df['est_interest'] - df['month_expense_amt']
+        # No expense in a month gives a NaN rather than an infinite percentage error
+        df['pct_error'] = df['error'] / df['month_expense_amt'].where(df['month_expense_amt'] != 0)
+
+        grouped = df.groupby('debt_type', observed=True)
+        df['cum_est_interest'] = grouped['est_interest'].cumsum()
+        df['cum_month_expense_amt'] = grouped['month_expense_amt'].cumsum()
+
+        metrics.increment('projected_interest_batch.rows', len(df))
+        return df[['debt_type', 'date', 'est_interest', 'month_expense_amt', 'error', 'pct_error',
+                   'cum_est_interest', 'cum_month_expense_amt']]
+
+    def summary(self):
+        """ Error metrics per debt type """
+        df = self.df.assign(abs_error=self.df['error'].abs(),
+                            abs_pct_error=self.df['pct_error'].abs())
+        grouped = df.groupby('debt_type', observed=True)
+
+        summary = pd.DataFrame({'months': grouped.size(),
+                                'mean_error': grouped['error'].mean(),
+                                'mean_abs_error': grouped['abs_error'].mean(),
+                                'mean_abs_pct_error': grouped['abs_pct_error'].mean(),
+                                'cum_error': grouped['error'].sum()})
+        return summary.reset_index()
+
+    def get_debt_type(self, debt_type):
+        return self.df[self.df['debt_type'] == debt_type].reset_index(drop=True)
+
+    # Internal Functions
+    def _map_debt_type(self, df, column, source):
+        desc_to_type = {match[source]: debt_type for debt_type, match in self.debt_match.items()}
+        # Descriptions read from the shared store are categorical, debt_type is kept as plain strings
+        df = df.assign(debt_type=df[column].map(desc_to_type).astype(object))
+        return df[~df['debt_type'].isna()]
+
+
+if __name__ == '__main__':
+    batch = ProjectedInterestBatch()
+    print(batch.summary())
+    print(batch.get_debt_type('T-Bills').tail())
@@ -0,0 +1,209 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.backend.data.fiscaldata_treasury_gov.debt_to_the_penny import DebtToThePenny
+from src.backend.data.home_treasury_gov.daily_treasury_yield_curve import DailyTreasuryYieldCurve
+from src.backend.instrumentation import metrics, timed
+
+"""
+Incremental rolling / windowed kernels.
+
+Each kernel takes the new values of a series (in date order) and returns the kernel output for those rows only,
+keeping just enough state (the last window of values, a running max, a run length...) to continue on the next
+update. Appending n new rows therefore costs O(n + window) rather than recomputing the full history.
+
+"""
+
+
+class WindowKernel:
+    """ Rolling window statistic (mean, std, sum, min, max) over the last `window` rows """
+
+    def __init__(self, window, func='mean'):
+        assert func in ['mean', 'std', 'sum', 'min', 'max']
+        self.window = window
+        self.func = func
+        self._tail = pd.Series(dtype='float64')
+
+    def update(self, values):
+        _all = pd.concat([self._tail, values])
+        out = getattr(_all.rolling(self.window), self.func)().iloc[len(self._tail):]
+        self._tail = _all.iloc[-(self.window - 1):] if self.window > 1 else _all.iloc[0:0]
+        return out
+
+
+class ChangeKernel:
+    """ Change over the last `periods` rows """
+
+    def __init__(self, periods=1):
+        self.periods = periods
+        self._tail = pd.Series(dtype='float64')
+
+    def update(self, values):
+        _all = pd.concat([self._tail, values])
+        out = _all.diff(self.periods).iloc[len(self._tail):]
+        self._tail = _all.iloc[-self.periods:]
+        return out
+
+
+class DrawdownKernel:
+    """ Fractional drawdown from the running maximum """
+
+    def __init__(self):
+        self._running_max = -np.inf
+
+    def update(self, values):
+        running_max = values.cummax().clip(lower=self._running_max)
+        if len(values) > 0:
+            self._running_max = max(self._running_max, running_max.max())
+        return values / running_max - 1
+
+
+class InversionKernel:
+    """
+    Number of consecutive rows (including the current one) a spread has been below zero, 0 when not inverted.
+
+    The total number of inverted rows and inversion episodes seen so far are kept in `inverted_rows` / `episodes`.
+
+    """
+
+    def __init__(self):
+        self._run_length = 0
+        self.inverted_rows = 0
+        self.episodes = 0
+
+    def update(self, values):
+        inverted = (values < 0).to_numpy()
+
+        # Run length of consecutive inverted rows, carrying on the run from the previous update
+        breaks = np.flatnonzero(~inverted)
+        idx = np.arange(len(inverted))
+        last_break = np.full(len(inverted), -1)
+        last_break[breaks] = breaks
+        last_break = np.maximum.accumulate(last_break)
+        run_length = idx - last_break
+        run_length[last_break == -1] += self._run_length
+        run_length[~inverted] = 0
+
+        starts = inverted & np.concatenate([[self._run_length == 0], ~inverted[:-1]])
+        self.episodes += int(starts.sum())
+        self.inverted_rows += int(inverted.sum())
+        if len(run_length) > 0:
+            self._run_length = int(run_length[-1])
+
+        return pd.Series(run_length, index=values.index)
+
+
+class RollingAnalytics:
+    """
+    A set of named kernels kept up to date over a dataset.
+
+    Outputs are added in order with add(name, source, kernel), where source is a column of the dataset, a
+    previously added output, or a callable taking the new rows and returning a series. update() requests only the
+    rows after the last date seen and appends the kernel outputs for those rows to `result`.
+
+    """
+
+    def __init__(self, dataset, start_date):
+        self.dataset = dataset
+        self.start_date = start_date
+        self.last_date = None
+
+        self._outputs = list()
+        self._chunks = list()
+
+    def add(self, name, source, kernel=None):
+        self._outputs.append((name, source, kernel))
+
+    @property
+    def result(self):
+        if len(self._chunks) == 0:
+            return pd.DataFrame(columns=[name for name, _, _ in self._outputs])
+        if len(self._chunks) > 1:
+            self._chunks = [pd.concat(self._chunks)]
+        return self._chunks[0]
+
+    def update(self, end_date=None):
+        if end_date is None:
+            end_date = datetime.datetime.today()
+
+        start_date = self.start_date if self.last_date is None else self.last_date + datetime.timedelta(days=1)
+        if start_date > end_date:
+            return self.result.iloc[0:0]
+
+        df = self.dataset.get_all_data_between_dates(start_date=start_date, end_date=end_date)
+        return self.append(df)
+
+    @timed('rolling_analytics.append')
+    def append(self, df):
+        date_col = self.dataset.date_col_name
+        df = df.sort_values(by=date_col)
+        if self.last_date is not None:
+            df = df[df[date_col] > self.last_date]
+        df = df.set_index(date_col)
+
+        new = pd.DataFrame(index=df.index)
+        for name, source, kernel in self._outputs:
+            if callable(source):
+                values = source(df)
+            elif source in new.columns:
+                values = new[source]
+            else:
+                values = df[source]
+
+            values = values.astype('float64')
+            new[name] = values if kernel is None else kernel.update(values)
+
+        if len(new) > 0:
+            self.last_date = new.index[-1].to_pydatetime()
+            self._chunks.append(new)
+        metrics.increment('rolling_analytics.append.rows', len(new))
+        return new
+
+
+class YieldCurveAnalytics(RollingAnalytics):
+    """ 2s10s / 3m10y spreads, their inversions and rolling statistics and changes in the 10 Yr yield """
+
+    def __init__(self, start_date=datetime.datetime(year=1990, month=1, day=1), window=21):
+        super().__init__(dataset=DailyTreasuryYieldCurve(), start_date=start_date)
+
+        self.add('spread_2s10s', lambda df: df['10 Yr'] - df['2 Yr'])
+        self.add('spread_3m10y', lambda df: df['10 Yr'] - df['3 Mo'])
+
+        self.inversion_2s10s = InversionKernel()
+        self.inversion_3m10y = InversionKernel()
+        self.add('inversion_days_2s10s', 'spread_2s10s', self.inversion_2s10s)
+        self.add('inversion_days_3m10y', 'spread_3m10y', self.inversion_3m10y)
+
+        self.add('spread_2s10s_mean', 'spread_2s10s', WindowKernel(window=window, func='mean'))
+        self.add('spread_3m10y_mean', 'spread_3m10y', WindowKernel(window=window, func='mean'))
+
+        self.add('change_10y', '10 Yr', ChangeKernel(periods=1))
+        self.add('change_10y_window', '10 Yr', ChangeKernel(periods=window))
+        self.add('vol_10y', 'change_10y', WindowKernel(window=window, func='std'))
+
+
+class DebtAnalytics(RollingAnalytics):
+    """ Daily / windowed changes, rolling mean and drawdown of the total public debt outstanding """
+
+    def __init__(self, start_date=datetime.datetime(year=1993, month=4, day=1), window=21):
+        super().__init__(dataset=DebtToThePenny(), start_date=start_date)
+
+        self.add('change_tot_pub_debt', 'tot_pub_debt_out_amt', ChangeKernel(periods=1))
+        self.add('change_tot_pub_debt_window', 'tot_pub_debt_out_amt', ChangeKernel(periods=window))
+        self.add('mean_change_tot_pub_debt', 'change_tot_pub_debt', WindowKernel(window=window, func='mean'))
+        self.add('drawdown_tot_pub_debt', 'tot_pub_debt_out_amt', DrawdownKernel())
+
+
+if __name__ == '__main__':
+    yc_analytics = YieldCurveAnalytics()
+    yc_analytics.update(end_date=datetime.datetime(year=2022, month=1, day=1))
+    yc_analytics.update()
+    print(yc_analytics.result.tail())
+    print(f'2s10s inverted on {yc_analytics.inversion_2s10s.inverted_rows} days '
+          f'over {yc_analytics.inversion_2s10s.episodes} episodes')
+
+    debt_analytics = DebtAnalytics()
+    debt_analytics.update()
+    print(debt_analytics.result.tail())
@@ -2,43 +2,240 @@ import os
 
 import hashlib
 import datetime
+import time
 import pickle
+import functools
+import threading
+
+from src.backend.data.freshness import PROBE_MAX_AGE, TIME_FORMAT, get_freshness_index
+from src.backend.instrumentation import metrics
+
+CACHE_FOLDER = os.environ.get('MACRO_CACHE_FOLDER', '/data/tmp/cache/')
 
 
 class DataAPIBase:
 
     def __init__(self):
         self._from_cache = True
-        self._cache_folder = '/data/tmp/cache/'
+        self._cache_folder = CACHE_FOLDER
         self._date_col_name = 'date'
+        self._host = None
+        self._use_shared_store = True
+
+        # Label columns (e.g. security descriptions), every other column besides the date holds values
+        self._string_cols = list()
+
+        # Serve older cached data while a refresh runs in the background, see _fetch_or_serve_stale
+        self._serve_stale = True
+
+        # Record each download in the dataset's revision store, see _record_revision
+        self._record_revisions = True
 
     @property
     def date_col_name(self):
         return self._date_col_name
 
+    @property
+    def string_cols(self):
+        return self._string_cols
+
+    @property
+    def host(self):
+        return self._host
+
     def get_all_data_between_dates(self, start_date, end_date):
         raise NotImplementedError
 
+    def is_cached(self, start_date, end_date, fields=None):
+        raise NotImplementedError
+
+    def get_available_fields(self):
+        """ Names of the fields that can be requested from the source, None if they are not known """
+        return None
+
+    def get_latest_record_date(self):
+        """ The newest record date available from the source, requested without downloading the data """
+        raise NotImplementedError
+
+    @property
+    def freshness_index(self):
+        return get_freshness_index(self._cache_folder)
+
+    def iter_data_between_dates(self, start_date, end_date, fields=None, chunk_size=5000):
+        """ Yield the data in frames, datasets that can stream from their cache override this """
+        yield self.get_all_data_between_dates(start_date=start_date, end_date=end_date)
+
     def get_col_data_between_dates(self, start_date, end_date, search_column, search_str):
         raise NotImplementedError
 
+    def get_resampled_data(self, freq, agg='last', start_date=None, end_date=None, fields=None):
+        """
+        The data at freq ('monthly', 'quarterly' or 'annual') with one row per period end (and per combination of
+        the string_cols) and the value columns aggregated with agg ('last', 'mean' or 'sum').
+
+        The resampled frame is materialized and cached per (fields, freq, agg) and updated incrementally when new
+        raw rows arrive, see resample.py.
+        """
+        from src.backend.data.resample import period_end, resample_cache
+        df = resample_cache.get(self, freq=freq, agg=agg, fields=fields)
+
+        if start_date is not None:
+            df = df[df[self.date_col_name] >= start_date]
+        if end_date is not None:
+            df = df[df[self.date_col_name] <= period_end(end_date, freq)]
+        return df.reset_index(drop=True)
+
+    def is_resampled_cached(self, freq, agg='last', fields=None):
+        from src.backend.data.resample import resample_cache
+        return resample_cache.is_cached(self, freq=freq, agg=agg, fields=fields)
+
     @staticmethod
     def create_date(year, month, day):
         return datetime.datetime(year=year, month=month, day=day)
 
+    def _source_fields(self, fields):
+        # Fields as requested from the source, given the names of the formatted columns
+        return fields
+
+    # -- Shared Store Functions --
+    def _get_shared_data(self, start_date, end_date, fields=None):
+        """
+        Data from the shared store published by the loader process (see shared_store.py), None if unavailable.
+        String columns are categorical, with their codes mapped from the store.
+        """
+        if not self._use_shared_store:
+            return None
+
+        from src.backend.data.shared_store import get_shared_store
+        shared_store = get_shared_store()
+        if shared_store is None:
+            return None
+
+        # The columns are selected as the frame is built, selecting them afterwards would copy them
+        columns = None if fields is None else [self.date_col_name if f == 'record_date' else f for f in fields]
+        if columns is not None and self.date_col_name not in columns:
+            return None
+        df = shared_store.open(type(self).__name__, columns=columns)
+        if df is None:
+            return None
+
+        # The published frame is sorted by date, so the range is a slice (a view of the mapped columns) rather than
+        # a boolean mask that would copy them on every read
+        dates = df[self.date_col_name]
+        df = df.iloc[dates.searchsorted(start_date, side='left'):dates.searchsorted(end_date, side='right')]
+
+        df.index = range(len(df))
+        metrics.increment('shared_store.reads')
+        return df
+
+    # -- Fetch Functions --
+    def _fetch_or_serve_stale(self, key, fetch, get_stale):
+        """
+        Fetch data that is not (freshly) cached, falling back on older cached data.
+
+        fetch() requests and caches the data, get_stale() returns the best older data in the cache or None. If
+        there is older data it is returned straight away and fetch() runs in the background (stale-while-
+        revalidate). With _serve_stale = False (e.g. the loader process) fetch() runs now, and the older data is
+        only returned if it fails.
+        """
+        from src.backend.data.fetch_pipeline import FETCH_ERRORS, revalidator
+
+        stale = get_stale() if self._serve_stale else None
+        if stale is not None:
+            revalidator.submit(key, fetch)
+            metrics.increment('cache.served_stale')
+            return stale
+
+        try:
+            return fetch()
+        except FETCH_ERRORS as e:
+            stale = get_stale() if not self._serve_stale else None
+            if stale is None:
+                raise
+            print(f'Warning: {type(self).__name__} request failed ({e!r}), serving older cached data')
+            metrics.increment('cache.served_stale_on_error')
+            return stale
+
+    def _record_revision(self, get_df, start_date, end_date):
+        """
+        Queue a download of start_date - end_date (the frame returned by get_df()) to be recorded in the background
+        in the revision store named after the dataset, see RevisionRecorder
+        """
+        if not self._record_revisions:
+            return
+
+        from src.backend.data.revision_store import get_revision_store, revision_recorder
+        revision_recorder.submit(get_store=functools.partial(get_revision_store, type(self).__name__,
+                                                             date_col=self.date_col_name,
+                                                             folder=os.path.join(self._cache_folder, 'revisions')),
+                                 get_df=get_df, start_date=start_date, end_date=end_date)
+
     # -- Cache Functions --
-    def _load_data_from_cache(self, unique_str):
+    def _load_data_from_cache(self, unique_str, check_freshness=True):
         unique_fp = self._get_cache_path(unique_str)
+
+        if check_freshness and self._is_stale(unique_fp):
+            metrics.increment('cache.stale')
+            return None
+
         if os.path.exists(unique_fp):
-            with open(unique_fp, 'rb') as handle:
-                return pickle.load(handle)
+            with metrics.timer('cache.load'), open(unique_fp, 'rb') as handle:
+                data = pickle.load(handle)
+                metrics.increment('cache.load.bytes', handle.tell())
+                metrics.increment('cache.hits')
+                return data
         else:
+            metrics.increment('cache.misses')
+            return None
+
+    def _load_stale_data_from_cache(self, unique_str):
+        """ The cached data even if a freshness probe has marked it stale, None if there is none """
+        if not self._from_cache or not os.path.exists(self._get_cache_path(unique_str)):
             return None
+        return self._load_data_from_cache(unique_str, check_freshness=False)
 
     def _save_to_cache(self, unique_str, data):
         unique_fp = self._get_cache_path(unique_str)
-        with open(unique_fp, 'wb') as handle:
+        os.makedirs(self._cache_folder, exist_ok=True)
+
+        # Workers, the loader process and background refreshes share the cache folder, so the file is written
+        # under a name of its own and moved into place, readers never see it half written
+        tmp_fp = f'{unique_fp}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with metrics.timer('cache.save'), open(tmp_fp, 'wb') as handle:
             pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            metrics.increment('cache.save.bytes', handle.tell())
+        os.replace(tmp_fp, unique_fp)
+
+    def _record_latest_date(self, latest_date):
+        if latest_date is not None:
+            self.freshness_index.update_local_latest(type(self).__name__, latest_date)
+
+    def _is_in_cache(self, unique_str, check_freshness=True):
+        unique_fp = self._get_cache_path(unique_str)
+        if check_freshness and self._is_stale(unique_fp):
+            return False
+        return self._from_cache and os.path.exists(unique_fp)
+
+    def _get_unchanged_latest(self):
+        """
+        The newest downloaded date if a recent freshness probe (see PROBE_MAX_AGE) found nothing newer at the
+        source, else None
+        """
+        entry = self.freshness_index.get(type(self).__name__)
+        local_latest, remote_latest = entry.get('local_latest'), entry.get('remote_latest')
+        if local_latest is None or remote_latest is None or remote_latest > local_latest:
+            return None
+
+        probed = entry.get('probed')
+        if probed is None or \
+                time.time() - datetime.datetime.strptime(probed, TIME_FORMAT).timestamp() > PROBE_MAX_AGE:
+            return None
+        return local_latest
+
+    def _is_stale(self, unique_fp):
+        # A freshness probe found newer data than had been downloaded when this file was written
+        stale_after = self.freshness_index.get_stale_after(type(self).__name__)
+        return stale_after is not None and os.path.exists(unique_fp) and os.path.getmtime(unique_fp) < stale_after
 
     def _get_cache_path(self, unique_str):
         hex_str = hashlib.sha256(unique_str.encode()).hexdigest()
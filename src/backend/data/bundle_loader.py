@@ -0,0 +1,194 @@
+import datetime
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src.backend.instrumentation import metrics, timed
+
+
+class DatasetRequest:
+    """
+    Declares a single frame needed from a dataset.
+
+        name:           key of the frame in the loaded bundle
+        dataset:        a DataAPIBase instance, e.g. AvgInterestRates()
+        fields:         fields to request (None uses the dataset defaults)
+        search_column:  optional column to filter on, e.g. 'security_desc'
+        search_str:     value of search_column to keep
+        transform:      optional callable applied to the frame after filtering
+        freq:           optional 'monthly' / 'quarterly' / 'annual' to load the resampled data (see
+                        DataAPIBase.get_resampled_data) instead of the native resolution
+        agg:            aggregation used with freq: 'last', 'mean' or 'sum'
+
+    """
+
+    def __init__(self, name, dataset, start_date, end_date, fields=None,
+                 search_column=None, search_str=None, transform=None, freq=None, agg='last'):
+        assert isinstance(start_date, datetime.datetime)
+        assert isinstance(end_date, datetime.datetime)
+
+        self.name = name
+        self.dataset = dataset
+        self.start_date = start_date
+        self.end_date = end_date
+        self.fields = fields
+        self.search_column = search_column
+        self.search_str = search_str
+        self.transform = transform
+        self.freq = freq
+        self.agg = agg
+
+    @property
+    def fetch_key(self):
+        # Requests with the same key can be served by one fetch
+        fields = None if self.fields is None else tuple(self.fields)
+        return type(self.dataset).__name__, getattr(self.dataset, 'endpoint', None), fields, self.freq, self.agg
+
+
+class FetchJob:
+
+    def __init__(self, dataset, start_date, end_date, fields, freq=None, agg='last'):
+        self.dataset = dataset
+        self.start_date = start_date
+        self.end_date = end_date
+        self.fields = fields
+        self.freq = freq
+        self.agg = agg
+        self.requests = list()
+
+    def is_cached(self):
+        if self.freq is not None:
+            return self.dataset.is_resampled_cached(freq=self.freq, agg=self.agg, fields=self.fields)
+        return self.dataset.is_cached(start_date=self.start_date, end_date=self.end_date, fields=self.fields)
+
+    def run(self):
+        if self.freq is not None:
+            return self.dataset.get_resampled_data(freq=self.freq, agg=self.agg, start_date=self.start_date,
+                                                   end_date=self.end_date, fields=self.fields)
+        if self.fields is None:
+            return self.dataset.get_all_data_between_dates(start_date=self.start_date, end_date=self.end_date)
+        return self.dataset.get_all_data_between_dates(start_date=self.start_date, end_date=self.end_date,
+                                                       fields=self.fields)
+
+
+class BundleLoader:
+    """
+    Loads a bundle of frames from several datasets in one planned pass.
+
+    Requests for the same dataset and fields with overlapping (or adjacent) date ranges are merged into a single
+    fetch. Fetches that are already cached are served inline, the rest are run concurrently with at most
+    per_host_limit requests in flight to each host, so the load time is bounded by the slowest single fetch.
+
+        loader = BundleLoader([DatasetRequest('air', AvgInterestRates(), start, end,
+                                              search_column='security_desc', search_str='Treasury Bills'),
+                               DatasetRequest('dtyc', DailyTreasuryYieldCurve(), start, end)])
+        frames = loader.load()
+
+    """
+
+    def __init__(self, requests, max_workers=8, per_host_limit=2):
+        names = [request.name for request in requests]
+        assert len(names) == len(set(names)), 'Request names must be unique'
+
+        self.requests = requests
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+
+    def plan(self):
+        grouped = collections.defaultdict(list)
+        for request in self.requests:
+            grouped[request.fetch_key].append(request)
+
+        jobs = list()
+        for group in grouped.values():
+            group = sorted(group, key=lambda r: r.start_date)
+
+            job = None
+            for request in group:
+                if job is not None and request.start_date <= job.end_date + datetime.timedelta(days=1):
+                    job.end_date = max(job.end_date, request.end_date)
+                else:
+                    job = FetchJob(dataset=request.dataset,
+                                   start_date=request.start_date,
+                                   end_date=request.end_date,
+                                   fields=request.fields,
+                                   freq=request.freq,
+                                   agg=request.agg)
+                    jobs.append(job)
+                job.requests.append(request)
+
+        return jobs
+
+    @timed('bundle_loader.load')
+    def load(self):
+        jobs = self.plan()
+        metrics.increment('bundle_loader.requests', len(self.requests))
+        metrics.increment('bundle_loader.fetches', len(jobs))
+
+        cached_jobs = [job for job in jobs if job.is_cached()]
+        network_jobs = [job for job in jobs if job not in cached_jobs]
+
+        results = dict()
+        if len(network_jobs) > 0:
+            host_limits = collections.defaultdict(lambda: threading.BoundedSemaphore(self.per_host_limit))
+            for job in network_jobs:
+                _ = host_limits[job.dataset.host]  # Create semaphores before the workers start
+
+            def _run_limited(_job):
+                with host_limits[_job.dataset.host]:
+                    return _job.run()
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(network_jobs))) as executor:
+                futures = {executor.submit(_run_limited, job): job for job in network_jobs}
+
+                # Cached fetches run on this thread while the network fetches are in flight
+                for job in cached_jobs:
+                    results[job] = job.run()
+
+                for future, job in futures.items():
+                    results[job] = future.result()
+        else:
+            for job in cached_jobs:
+                results[job] = job.run()
+
+        frames = dict()
+        for job, data in results.items():
+            for request in job.requests:
+                frames[request.name] = self._slice(data=data, request=request)
+
+        return {request.name: frames[request.name] for request in self.requests}
+
+    def load_aligned(self):
+        """ Load the bundle with every frame indexed by the shared (union) date index """
+        frames = self.load()
+
+        all_dates = [frame[request.dataset.date_col_name] for request, frame in zip(self.requests, frames.values())]
+        shared_index = pd.DatetimeIndex(pd.concat(all_dates).unique()).sort_values()
+        shared_index.name = 'date'
+
+        aligned = dict()
+        for request in self.requests:
+            date_col = request.dataset.date_col_name
+            frame = frames[request.name]
+            if frame[date_col].duplicated().any():
+                raise ValueError(f'{request.name} has more than one row per date, '
+                                 f'add a search_column/transform to reduce it before aligning')
+            aligned[request.name] = frame.set_index(date_col).reindex(shared_index)
+        return aligned
+
+    @staticmethod
+    def _slice(data, request):
+        date_col = request.dataset.date_col_name
+        data = data[(data[date_col] >= request.start_date) & (data[date_col] <= request.end_date)]
+
+        if request.search_column is not None:
+            assert request.search_str in data[request.search_column].unique()
+            data = data[data[request.search_column] == request.search_str]
+
+        data = data.reset_index(drop=True)
+
+        if request.transform is not None:
+            data = request.transform(data)
+        return data
@@ -0,0 +1,7 @@
+import datetime
+
+# Start of the history that is loaded, published and exported when no start date is given
+DEFAULT_START_DATE = datetime.datetime(year=1990, month=1, day=1)
+
+# Daily Treasury par yield curve maturities, in the order of the CSV columns
+TENORS = ['1 Mo', '2 Mo', '3 Mo', '4 Mo', '6 Mo', '1 Yr', '2 Yr', '3 Yr', '5 Yr', '7 Yr', '10 Yr', '20 Yr', '30 Yr']
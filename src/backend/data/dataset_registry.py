@@ -0,0 +1,21 @@
+import importlib
+
+# Dataset name -> (module, class), modules are only imported when a dataset is requested
+DATASETS = {'avg_interest_rates': ('src.backend.data.fiscaldata_treasury_gov.avg_interest_rates',
+                                   'AvgInterestRates'),
+            'debt_to_penny': ('src.backend.data.fiscaldata_treasury_gov.debt_to_the_penny',
+                              'DebtToThePenny'),
+            'historical_debt_outstanding': ('src.backend.data.fiscaldata_treasury_gov.historical_debt_outstanding',
+                                            'HistoricalDebtOutstanding'),
+            'interest_on_debt_outstanding': ('src.backend.data.fiscaldata_treasury_gov.interest_on_debt_outstanding',
+                                             'InterestOnDebtOutstanding'),
+            'summary_of_treasury_securities_outstanding': ('src.backend.data.fiscaldata_treasury_gov.'
+                                                           'summary_of_treasury_securities_outstanding',
+                                                           'SummaryOfTreasurySecuritiesOutstanding'),
+            'daily_treasury_yield_curve': ('src.backend.data.home_treasury_gov.daily_treasury_yield_curve',
+                                           'DailyTreasuryYieldCurve')}
+
+
+def get_dataset(name):
+    module_name, class_name = DATASETS[name]
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -20,4 +20,12 @@ def get_debt_matching_dict():
     _dict['TIPS']['fiscaldata'] = 'Treasury Inflation-Protected Securities (TIPS)'
     _dict['TIPS']['hometreasury'] = 'Treasury Inflation-Protected Securities'
 
+    _dict['FRN'] = dict()
+    _dict['FRN']['fiscaldata'] = 'Treasury Floating Rate Notes (FRN)'
+    _dict['FRN']['hometreasury'] = 'Floating Rate Notes'
+
+    _dict['FFB'] = dict()
+    _dict['FFB']['fiscaldata'] = 'Federal Financing Bank'
+    _dict['FFB']['hometreasury'] = 'Federal Financing Bank'
+
     return _dict
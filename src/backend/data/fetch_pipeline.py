@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+from src.backend.instrumentation import metrics
+
+"""
+Fault tolerant fetching for the data sources.
+
+Every request to a source (host) goes through its FetchPipeline:
+
+    - Circuit breaker: after failure_threshold consecutive failures (connection errors, timeouts, 5xx) the source
+      is considered down and requests fail straight away with CircuitOpenError for reset_timeout seconds, then a
+      single trial request decides whether it closes again.
+    - Hedging: if a request has not answered after the hedge delay (the p95 of the source's recent latencies, or
+      MACRO_HEDGE_AFTER seconds until there are enough samples) an identical request is sent and the first good
+      response is used.
+
+The revalidator runs cache refreshes in the background, so the datasets can serve older cached data straight away
+(stale-while-revalidate, see DataAPIBase._fetch_or_serve_stale). Listeners are notified after each refresh, e.g.
+to drop cached page layouts.
+
+"""
+
+HEDGE_AFTER = float(os.environ.get('MACRO_HEDGE_AFTER', 5.0))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# Errors after which older cached data can be served instead
+FETCH_ERRORS = (requests.exceptions.RequestException, CircuitOpenError)
+
+
+class CircuitBreaker:
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def before_request(self):
+        """ Raise CircuitOpenError if the source is down, in half open state only one trial request is let through """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return
+        metrics.increment(f'fetch.{self.name}.rejected')
+        raise CircuitOpenError(f'{self.name} is unavailable, retrying after {self.reset_timeout:.0f} s')
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f'{self.name} is available again')
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print(f'Warning: {self.name} failed {self._failures} times, pausing requests')
+                    metrics.increment(f'fetch.{self.name}.opened')
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+
+class FetchPipeline:
+
+    def __init__(self, source, breaker=None, hedge_after=HEDGE_AFTER, min_samples=20, timeout=60):
+        self.source = source
+        self.breaker = CircuitBreaker(source) if breaker is None else breaker
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self.timeout = timeout
+
+        self._latencies = collections.deque(maxlen=200)
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix=f'fetch-{source}')
+
+    def get(self, url, params=None, timeout=None):
+        """ GET url through the circuit breaker with hedging, raises for error responses like raise_for_status """
+        self.breaker.before_request()
+        try:
+            response = self._hedged_get(url=url, params=params, timeout=self.timeout if timeout is None else timeout)
+        except Exception:
+            self.breaker.record_failure()
+            metrics.increment(f'fetch.{self.source}.failures')
+            raise
+
+        # Client errors are the request's fault, they do not count against the source
+        self.breaker.record_success()
+        response.raise_for_status()
+        return response
+
+    def hedge_delay(self):
+        if len(self._latencies) < self.min_samples:
+            return self.hedge_after
+        latencies = sorted(self._latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    # Internal Functions
+    def _get_once(self, url, params, timeout):
+        start = time.perf_counter()
+        response = requests.get(url, params=params, timeout=timeout)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        self._latencies.append(time.perf_counter() - start)
+        return response
+
+    def _hedged_get(self, url, params, timeout):
+        futures = {self._executor.submit(self._get_once, url, params, timeout)}
+        done, _ = wait(futures, timeout=self.hedge_delay())
+        if len(done) == 0:
+            metrics.increment(f'fetch.{self.source}.hedged')
+            futures.add(self._executor.submit(self._get_once, url, params, timeout))
+
+        # The first good response wins, the other request is left to finish on its own
+        errors = list()
+        pending = futures
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except requests.exceptions.RequestException as e:
+                    errors.append(e)
+        raise errors[0]
+
+
+_pipelines = dict()
+_pipelines_lock = threading.Lock()
+
+
+def get_fetch_pipeline(source):
+    """ The process wide pipeline (and circuit breaker) of a source, e.g. 'api.fiscaldata.treasury.gov' """
+    with _pipelines_lock:
+        if source not in _pipelines:
+            _pipelines[source] = FetchPipeline(source)
+        return _pipelines[source]
+
+
+class Revalidator:
+    """ Runs cache refreshes in the background, at most one at a time per key """
+
+    def __init__(self, max_workers=2):
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._listeners = list()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='revalidate')
+
+    def submit(self, key, refresh):
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+        self._executor.submit(self._run, key, refresh)
+        return True
+
+    def add_listener(self, callback):
+        """ callback() is called after every successful background refresh """
+        self._listeners.append(callback)
+
+    def wait(self, timeout=None):
+        """ Block until no refreshes are in flight, returns False on timeout """
+        start = time.time()
+        while len(self._in_flight) > 0:
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # Internal Functions
+    def _run(self, key, refresh):
+        try:
+            refresh()
+            metrics.increment('revalidate.refreshed')
+            for callback in self._listeners:
+                callback()
+        except Exception as e:
+            print(f'Warning: Background refresh failed, older data is kept: {e!r}')
+            metrics.increment('revalidate.errors')
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+
+revalidator = Revalidator()
@@ -0,0 +1,27 @@
+import os
+import fcntl
+import contextlib
+
+from src.backend.instrumentation import metrics
+
+"""
+Advisory file locks for files that several processes write, e.g. the gunicorn workers, the shared store loader
+and background refreshes all share one cache folder.
+
+    with file_lock(os.path.join(cache_folder, 'snapshot.lock')):
+        ...
+
+"""
+
+
+@contextlib.contextmanager
+def file_lock(lock_fp):
+    """ Hold an exclusive lock on lock_fp (created if missing) for the duration of the block """
+    os.makedirs(os.path.dirname(lock_fp), exist_ok=True)
+    with open(lock_fp, 'a') as handle:
+        with metrics.timer('file_lock.wait'):
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
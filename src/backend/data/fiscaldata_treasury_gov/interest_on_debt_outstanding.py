@@ -1,7 +1,5 @@
 import datetime
 
-import matplotlib.pyplot as plt
-
 from src.backend.data.fiscaldata_treasury_gov.treasury_api import TreasuryAPI
 
 
@@ -37,6 +35,8 @@ class InterestOnDebtOutstanding(TreasuryAPI):
         super().__init__(endpoint=_end_point,
                          default_fields=_default_fields)
 
+        self._string_cols = ['expense_catg_desc', 'expense_group_desc', 'expense_type_desc']
+
     def print_list_of_expense_type_desc(self):
         start_date = datetime.datetime.now() - datetime.timedelta(days=60)
         end_date = datetime.datetime.now()
@@ -49,12 +49,15 @@ class InterestOnDebtOutstanding(TreasuryAPI):
     def get_expense_type_data_between_dates(self, start_date, end_date, expense_type_desc):
         data = self.get_all_data_between_dates(start_date=start_date,
                                                 end_date=end_date)
+        return self.flatten_expense_type(data=data, expense_type_desc=expense_type_desc)
 
+    @staticmethod
+    def flatten_expense_type(data, expense_type_desc):
         assert expense_type_desc in data['expense_type_desc'].unique()
 
         data = data[data['expense_type_desc'] == expense_type_desc]
         data = data.drop(columns=['expense_group_desc', 'expense_type_desc'])  # Drop columns that aren't needed
-        group_data = data.groupby(['expense_catg_desc', 'date']).sum()
+        group_data = data.groupby(['expense_catg_desc', 'date'], observed=True).sum()
         flat_data = group_data.reset_index()
         assert len(flat_data['expense_catg_desc'].unique()) == 1
         flat_data = flat_data.drop(columns=['expense_catg_desc'])
@@ -73,6 +76,7 @@ if __name__ == '__main__':
                                                      end_date=_end_date,
                                                      expense_type_desc='Treasury Bonds')
 
+    import matplotlib.pyplot as plt
     plt.subplot(2, 1, 1)
     plt.plot(_data['date'], _data['month_expense_amt'])
     plt.title('Month Expense Amount')
@@ -32,6 +32,8 @@ class SummaryOfTreasurySecuritiesOutstanding(TreasuryAPI):
         super().__init__(endpoint=_end_point,
                          default_fields=_default_fields)
 
+        self._string_cols = ['security_type_desc', 'security_class_desc']
+
     def print_list_of_security_class_desc(self):
         start_date = datetime.datetime(year=2021, month=1, day=1)
         end_date = datetime.datetime.now()
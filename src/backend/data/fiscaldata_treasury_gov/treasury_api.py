@@ -1,12 +1,18 @@
 import json
 import hashlib
 import datetime
-import os.path
-
-import requests
-import pandas as pd
+import functools
+import os
+import urllib.parse
 
 from src.backend.data.api_base import DataAPIBase
+from src.backend.data.fetch_pipeline import FETCH_ERRORS, get_fetch_pipeline
+from src.backend.data.fiscaldata_treasury_gov.treasury_schema import schema_registry
+from src.backend.instrumentation import metrics, timed
+
+# Can be pointed at a local stand-in server, e.g. for load testing
+FISCALDATA_BASE_URL = os.environ.get('MACRO_FISCALDATA_URL',
+                                     'https://api.fiscaldata.treasury.gov/services/api/fiscal_service')
 
 
 class TreasuryAPI(DataAPIBase):
@@ -20,14 +26,16 @@ class TreasuryAPI(DataAPIBase):
 
     def __init__(self, endpoint, default_fields):
         super().__init__()
-        self.base_url = 'https://api.fiscaldata.treasury.gov/services/api/fiscal_service'
+        self.base_url = FISCALDATA_BASE_URL
         self.endpoint = endpoint
+        self._host = urllib.parse.urlparse(self.base_url).netloc
 
         # Remove trailing '/' if present
         if self.endpoint[-1] == '/':
             self.endpoint = self.endpoint[:-1]
 
         self._default_fields = default_fields
+        self._available_fields = None
 
     def get_all_data_between_dates(self, start_date, end_date, fields=None):
         assert isinstance(start_date, datetime.datetime)
@@ -36,21 +44,152 @@ class TreasuryAPI(DataAPIBase):
         if fields is None:
             fields = self.default_fields
 
-        start_date_str = start_date.strftime('%Y-%m-%d')
-        end_date_str = end_date.strftime('%Y-%m-%d')
-
-        start_filter = self.create_filter(field_name='record_date', operator='gte', value=start_date_str)
-        end_filter = self.create_filter(field_name='record_date', operator='lte', value=end_date_str)
-        filters = [start_filter, end_filter]
+        shared_data = self._get_shared_data(start_date=start_date, end_date=end_date, fields=fields)
+        if shared_data is not None:
+            return shared_data
 
+        filters = self._create_date_filters(start_date=start_date, end_date=end_date)
         return self.send_request(fields=fields, filters=filters)
 
+    def is_cached(self, start_date, end_date, fields=None):
+        if fields is None:
+            fields = self.default_fields
+
+        filters = self._create_date_filters(start_date=start_date, end_date=end_date)
+        req_str = self._create_request_str(fields=fields, filters=filters, page_size=1000)
+        return self._is_in_cache(req_str)
+
     def get_col_data_between_dates(self, start_date, end_date, search_column, search_str, fields=None):
         data = self.get_all_data_between_dates(start_date=start_date, end_date=end_date, fields=fields)
         assert search_str in data[search_column].unique()
         return data[data[search_column] == search_str].reset_index(drop=True)
 
+    def iter_data_between_dates(self, start_date, end_date, fields=None, chunk_size=5000):
+        """
+        Yield the formatted data in frames of at most chunk_size rows. Cached responses (or the last good one) are
+        served as usual, anything else is requested and formatted a page at a time, see _iter_pages.
+        """
+        if fields is None:
+            fields = self.default_fields
+
+        filters = self._create_date_filters(start_date=start_date, end_date=end_date)
+        if self._is_in_cache(self._create_request_str(fields=fields, filters=filters, page_size=1000)) or \
+                self._is_in_cache(self._last_good_key(fields=fields, filters=filters), check_freshness=False):
+            pages = [self._request_all_pages(fields=fields, filters=filters)]
+        else:
+            pages = self._iter_pages(fields=fields, filters=filters)
+
+        for raw_data in pages:
+            schema = schema_registry.get_schema(endpoint=self.endpoint, raw_data=raw_data)
+            for i in range(0, len(raw_data['data']), chunk_size):
+                df = schema.format(raw_data['data'][i:i + chunk_size])
+                yield df.rename(columns={'record_date': self.date_col_name})
+
     def send_request(self, fields, filters):
+        data = self._request_all_pages(fields=fields, filters=filters)
+        formatted_data = self._format_data(data)
+        return formatted_data
+
+    def get_available_fields(self):
+        if self._available_fields is None:
+            unique_str = f'{self.endpoint}.available_fields'
+            available_fields = self._load_stale_data_from_cache(unique_str)
+
+            if available_fields is None:
+                # A single record without a fields parameter holds every field
+                try:
+                    with metrics.timer('treasury_api.available_fields'):
+                        response = get_fetch_pipeline(self.host).get(f'{self.base_url}/{self.endpoint}',
+                                                                     params={'page[number]': 1, 'page[size]': 1},
+                                                                     timeout=30)
+                except FETCH_ERRORS as e:
+                    print(f'Warning: The fields of {self.endpoint} could not be requested: {e!r}')
+                    return None
+
+                payload = response.json()
+                available_fields = list(payload['data'][0].keys()) if len(payload['data']) > 0 \
+                    else list(payload['meta']['dataTypes'].keys())
+                self._save_to_cache(unique_str, available_fields)
+            self._available_fields = available_fields
+        return self._available_fields
+
+    def get_latest_record_date(self):
+        # Only the newest record_date is requested (sorted descending, page size 1)
+        with metrics.timer('treasury_api.probe'):
+            response = get_fetch_pipeline(self.host).get(f'{self.base_url}/{self.endpoint}',
+                                                         params={'fields': 'record_date', 'sort': '-record_date',
+                                                                 'page[number]': 1, 'page[size]': 1},
+                                                         timeout=30)
+        metrics.increment('treasury_api.probe.bytes', len(response.content))
+
+        data = response.json()['data']
+        if len(data) == 0:
+            return None
+        return datetime.datetime.strptime(data[0]['record_date'], '%Y-%m-%d')
+
+    def _source_fields(self, fields):
+        # The formatted frames call 'record_date' by the dataset's date column
+        if fields is None:
+            return None
+        return ['record_date'] + [f for f in fields if f not in ['record_date', self.date_col_name]]
+
+    def _request_all_pages(self, fields, filters):
+        if self._is_in_cache(self._create_request_str(fields=fields, filters=filters, page_size=1000)):
+            return self._send_all_pages(fields=fields, filters=filters)
+
+        unchanged_data = self._load_unchanged(fields=fields, filters=filters)
+        if unchanged_data is not None:
+            metrics.increment('freshness.skipped_downloads')
+            return unchanged_data
+
+        # The cache keys include the end date, so a new day is never cached yet. Serve the last good response for
+        # the same fields and start date while it is requested (or if the request fails), see DataAPIBase.
+        return self._fetch_or_serve_stale(key=self._last_good_key(fields=fields, filters=filters),
+                                          fetch=functools.partial(self._fetch_all_pages, fields=fields,
+                                                                  filters=filters),
+                                          get_stale=functools.partial(self._load_last_good, fields=fields,
+                                                                      filters=filters))
+
+    def _fetch_all_pages(self, fields, filters):
+        data = self._send_all_pages(fields=fields, filters=filters)
+        self._save_last_good(fields=fields, filters=filters, total_count=data['meta']['total-count'])
+        self._record_pages(fields=fields, filters=filters, data=data)
+        return data
+
+    def _iter_pages(self, fields, filters, page_size=1000):
+        """
+        Yield the response one page at a time. Once every page has been received they are cached together, the
+        way _fetch_all_pages would have, so later requests do not page again.
+        """
+        data = self._send_request(fields=fields, filters=filters, page_size=page_size)
+        yield data
+
+        total_pages = data['meta']['total-pages']
+        records = list(data['data'])
+        for page_number in range(2, total_pages + 1):
+            page = self._send_request(fields=fields, filters=filters, page_size=page_size, page_number=page_number)
+            records.extend(page['data'])
+            yield page
+
+        total_count = data['meta']['total-count']
+        if total_pages > 1:
+            meta = dict(data['meta'], count=len(records), **{'total-pages': 1})
+            data = dict(data, data=records, meta=meta)
+            self._save_to_cache(self._create_request_str(fields=fields, filters=filters, page_size=total_count),
+                                data)
+        self._save_last_good(fields=fields, filters=filters, total_count=total_count)
+        self._record_pages(fields=fields, filters=filters, data=data)
+
+    def _record_pages(self, fields, filters, data):
+        # Revisions are recorded for the default fields, other fields would hash to different rows
+        if self._record_revisions and list(fields) == list(self.default_fields):
+            start_date, end_date = [None if value is None else datetime.datetime.strptime(value, '%Y-%m-%d')
+                                    for value in [self._get_filter_value(filters, 'gte'),
+                                                  self._get_filter_value(filters, 'lte')]]
+            self._record_revision(get_df=functools.partial(self._format_data, data), start_date=start_date,
+                                  end_date=end_date)
+
+    def _send_all_pages(self, fields, filters):
         data = self._send_request(fields=fields, filters=filters)
 
         if data['meta']['total-pages'] == 0:
@@ -62,9 +201,7 @@ class TreasuryAPI(DataAPIBase):
 
         # Ensure that the total number of pages == 1 - this ensures we have all the data
         assert data['meta']['total-pages'] <= 1
-
-        formatted_data = self._format_data(data)
-        return formatted_data
+        return data
 
     @property
     def default_fields(self):
@@ -80,8 +217,73 @@ class TreasuryAPI(DataAPIBase):
         return f'{field_name}:{operator}:{value}'
 
     # Internal Functions
-    def _send_request(self, fields, filters, page_size=1000):
-        req_str = self._create_request_str(fields=fields, filters=filters, page_size=page_size)
+    def _last_good_key(self, fields, filters):
+        return f'{self.endpoint}.last_good.{tuple(fields)}.{self._get_filter_value(filters, "gte")}'
+
+    def _save_last_good(self, fields, filters, total_count):
+        # Points at the request that holds every row, the first page if there are no more than 1000
+        page_size = max(total_count, 1000)
+        self._save_to_cache(self._last_good_key(fields=fields, filters=filters),
+                            {'request_str': self._create_request_str(fields=fields, filters=filters,
+                                                                     page_size=page_size),
+                             'end_date': self._get_filter_value(filters, 'lte')})
+
+    def _load_last_good(self, fields, filters):
+        """ The last response received for the same fields and start date, limited to the requested end date """
+        pointer = self._load_stale_data_from_cache(self._last_good_key(fields=fields, filters=filters))
+        if pointer is None:
+            return None
+
+        data = self._load_stale_data_from_cache(pointer['request_str'])
+        if data is None:
+            return None
+
+        end_date = self._get_filter_value(filters, 'lte')
+        if end_date is not None and pointer['end_date'] is not None and end_date < pointer['end_date']:
+            # Dates are ISO formatted, so they compare as strings
+            data = dict(data, data=[row for row in data['data'] if row['record_date'] <= end_date])
+            data['meta'] = dict(data['meta'], count=len(data['data']), **{'total-count': len(data['data'])})
+        return data
+
+    def _load_unchanged(self, fields, filters):
+        """
+        The last good response if the last freshness probe found nothing newer than local_latest at the source and
+        the response already holds local_latest (or the requested end date, if earlier), otherwise None.
+        """
+        local_latest = self._get_unchanged_latest()
+        if local_latest is None:
+            return None
+
+        data = self._load_last_good(fields=fields, filters=filters)
+        if data is None or len(data['data']) == 0:
+            return None
+
+        end_date = self._get_filter_value(filters, 'lte')
+        required_date = local_latest if end_date is None else min(local_latest, end_date)
+        if max(row['record_date'] for row in data['data']) < required_date:
+            return None
+        return data
+
+    @staticmethod
+    def _get_filter_value(filters, operator):
+        # e.g. 'record_date:gte:2020-01-01' -> '2020-01-01'
+        for _filter in filters if filters is not None else []:
+            if _filter.startswith(f'record_date:{operator}:'):
+                return _filter.split(':', 2)[2]
+        return None
+
+    def _create_date_filters(self, start_date, end_date):
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        end_date_str = end_date.strftime('%Y-%m-%d')
+
+        start_filter = self.create_filter(field_name='record_date', operator='gte', value=start_date_str)
+        end_filter = self.create_filter(field_name='record_date', operator='lte', value=end_date_str)
+        return [start_filter, end_filter]
+
+    @timed('treasury_api.send_request')
+    def _send_request(self, fields, filters, page_size=1000, page_number=1):
+        req_str = self._create_request_str(fields=fields, filters=filters, page_size=page_size,
+                                           page_number=page_number)
 
         data = None
         if self._from_cache:
@@ -89,7 +291,11 @@ class TreasuryAPI(DataAPIBase):
 
         if data is None:
             print('Requesting Data from Treasury API')
-            data = requests.get(req_str).json()
+            with metrics.timer('treasury_api.network'):
+                response = get_fetch_pipeline(self.host).get(req_str)
+            metrics.increment('treasury_api.network.requests')
+            metrics.increment('treasury_api.network.bytes', len(response.content))
+            data = response.json()
 
             # Add API Usage data
             data['api_usage_info'] = {}
@@ -100,9 +306,13 @@ class TreasuryAPI(DataAPIBase):
 
             self._save_to_cache(req_str, data)
 
+            record_dates = [row['record_date'] for row in data['data'] if 'record_date' in row]
+            if len(record_dates) > 0:
+                self._record_latest_date(datetime.datetime.strptime(max(record_dates), '%Y-%m-%d'))
+
         return data
 
-    def _create_request_str(self, fields, filters, page_size):
+    def _create_request_str(self, fields, filters, page_size, page_number=1):
         base_str = f'{self.base_url}/'
         base_str += f'{self.endpoint}'
         base_str += f'{self._add_fields(fields)}'
@@ -111,7 +321,7 @@ class TreasuryAPI(DataAPIBase):
             base_str += f'&{self._add_filters(filters)}'
 
         # Add Page Size
-        base_str += f', &page[number]=1&page[size]={page_size}'
+        base_str += f', &page[number]={page_number}&page[size]={page_size}'
         return base_str
 
     @staticmethod
@@ -128,35 +338,11 @@ class TreasuryAPI(DataAPIBase):
             _base_str += f'{field},'
         return _base_str[:-1]
 
+    @timed('treasury_api.format_data')
     def _format_data(self, raw_data):
-
-        df = pd.DataFrame(raw_data['data'])
-
-        for i, col in enumerate(df.columns):
-            data_type = raw_data['meta']['dataTypes'][col]
-
-            if col == 'record_date':
-                assert raw_data['meta']['dataFormats'][col] == 'YYYY-MM-DD'
-                df['record_date'] = pd.to_datetime(df['record_date'], format='%Y-%m-%d')
-
-            elif data_type == 'CURRENCY':
-                multiplier = 1
-                # Handle Columns that are expressed in Millions, e.g. [Debt Held by the Public (in Millions)]
-                if '_mil_' in col:
-                    multiplier = 1e6
-                df[col] = pd.to_numeric(df[col], errors='coerce') * multiplier
-
-            elif data_type == 'PERCENTAGE':
-                df[col] = pd.to_numeric(df[col], errors='coerce') / 100
-
-            elif data_type == 'NUMBER':
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-            elif data_type == 'STRING':
-                continue
-
-            else:
-                raise NotImplementedError
+        schema = schema_registry.get_schema(endpoint=self.endpoint, raw_data=raw_data)
+        df = schema.format(raw_data['data'])
+        metrics.increment('treasury_api.format_data.rows', len(df))
 
         df = df.rename(columns={'record_date': self.date_col_name})
         return df
@@ -0,0 +1,124 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.backend.instrumentation import metrics
+
+
+class TreasurySchema:
+    """
+    A compiled schema for a Fiscal Data payload.
+
+    The column types in meta.dataTypes are resolved once into a list of date columns, numeric columns (with a
+    per column scale for millions / percentages) and string columns. format() then converts a raw payload into a
+    typed frame with a single to_numeric call over all numeric columns.
+
+    """
+
+    DATE_FORMATS = {'YYYY-MM-DD': '%Y-%m-%d'}
+
+    def __init__(self, columns, data_types, data_formats):
+        self.columns = list(columns)
+
+        self.date_cols = dict()
+        self.numeric_cols = list()
+        self.string_cols = list()
+        scales = list()
+
+        unsupported = list()
+        for col in self.columns:
+            data_type = data_types.get(col)
+
+            if col == 'record_date' or data_type == 'DATE':
+                data_format = data_formats.get(col)
+                if data_format not in self.DATE_FORMATS:
+                    unsupported.append(f'{col} (DATE format {data_format})')
+                    continue
+                self.date_cols[col] = self.DATE_FORMATS[data_format]
+
+            elif data_type == 'CURRENCY':
+                # Handle Columns that are expressed in Millions, e.g. [Debt Held by the Public (in Millions)]
+                self.numeric_cols.append(col)
+                scales.append(1e6 if '_mil_' in col else 1)
+
+            elif data_type == 'PERCENTAGE':
+                self.numeric_cols.append(col)
+                scales.append(1 / 100)
+
+            elif data_type == 'NUMBER':
+                self.numeric_cols.append(col)
+                scales.append(1)
+
+            elif data_type == 'STRING':
+                self.string_cols.append(col)
+
+            else:
+                unsupported.append(f'{col} ({data_type})')
+
+        # Report every unsupported column up front instead of failing part way through a conversion
+        if len(unsupported) > 0:
+            raise ValueError(f'Unsupported column types in Treasury payload: {", ".join(unsupported)}')
+
+        self.scales = np.array(scales, dtype='float64')
+
+    @staticmethod
+    def signature(columns, data_types, data_formats):
+        return tuple((col, data_types.get(col), data_formats.get(col)) for col in columns)
+
+    def format(self, records):
+        df = pd.DataFrame.from_records(records, columns=self.columns)
+
+        for col, date_format in self.date_cols.items():
+            df[col] = pd.to_datetime(df[col], format=date_format)
+
+        if len(self.numeric_cols) > 0:
+            values = df[self.numeric_cols].to_numpy(dtype=object).ravel()
+            values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64')
+            values = values.reshape(len(df), len(self.numeric_cols)) * self.scales
+            df[self.numeric_cols] = values
+
+        return df
+
+
+class SchemaRegistry:
+    """ Caches compiled schemas per endpoint and flags columns whose type changes between payloads """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = dict()
+        self._known_columns = dict()
+
+    def get_schema(self, endpoint, raw_data):
+        data_types = raw_data['meta']['dataTypes']
+        data_formats = raw_data['meta']['dataFormats']
+
+        if len(raw_data['data']) > 0:
+            columns = list(raw_data['data'][0].keys())
+        else:
+            columns = list(data_types.keys())
+
+        signature = TreasurySchema.signature(columns=columns, data_types=data_types, data_formats=data_formats)
+        key = (endpoint, signature)
+
+        with self._lock:
+            schema = self._schemas.get(key)
+            if schema is None:
+                self._check_drift(endpoint=endpoint, signature=signature)
+                schema = TreasurySchema(columns=columns, data_types=data_types, data_formats=data_formats)
+                self._schemas[key] = schema
+                metrics.increment('treasury_schema.compiled')
+
+        return schema
+
+    def _check_drift(self, endpoint, signature):
+        known_columns = self._known_columns.setdefault(endpoint, dict())
+        for col, data_type, data_format in signature:
+            if col in known_columns and known_columns[col] != (data_type, data_format):
+                print(f'Warning: Schema drift in {endpoint}: {col} changed from {known_columns[col]} '
+                      f'to {(data_type, data_format)}')
+                metrics.increment('treasury_schema.drift')
+            known_columns[col] = (data_type, data_format)
+
+
+schema_registry = SchemaRegistry()
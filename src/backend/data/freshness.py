@@ -0,0 +1,145 @@
+import os
+import copy
+import json
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.backend.data.file_lock import file_lock
+from src.backend.instrumentation import metrics
+
+"""
+Freshness tracking for the dataset caches.
+
+Each dataset records the newest record_date it has downloaded ('local_latest'). A probe asks the source for just
+its newest record_date ('remote_latest', see get_latest_record_date) and, only when that is newer, marks the
+dataset's cache entries written before the probe as stale ('stale_after') so the next request downloads again.
+Results are kept in freshness.json in the cache folder for the scheduler and counted in the metrics.
+
+    python -m src.backend.data.freshness
+
+"""
+
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# How long (seconds) a probe that found nothing new is trusted to skip downloads, by default the shared store's
+# publish interval (the loader probes before each publish)
+PROBE_MAX_AGE = float(os.environ.get('MACRO_PROBE_MAX_AGE', os.environ.get('MACRO_PUBLISH_INTERVAL', '3600')))
+
+
+class FreshnessIndex:
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+
+        # The parsed index and the stat of the file it was read from, every cache read checks the index
+        self._index = dict()
+        self._index_stat = None
+
+    def get(self, name):
+        with self._lock:
+            return dict(self._read().get(name, dict()))
+
+    def get_all(self):
+        with self._lock:
+            return copy.deepcopy(self._read())
+
+    def update(self, name, **values):
+        # Workers, the loader process and background refreshes all write the index
+        with self._lock, file_lock(f'{self.filepath}.lock'):
+            index = copy.deepcopy(self._read())
+            index.setdefault(name, dict()).update(values)
+            self._write(index)
+
+    def update_local_latest(self, name, latest_date):
+        """ Keep the newest record_date downloaded for name, older ranges never lower it """
+        latest_str = latest_date.strftime(DATE_FORMAT)
+        with self._lock, file_lock(f'{self.filepath}.lock'):
+            index = copy.deepcopy(self._read())
+            entry = index.setdefault(name, dict())
+            if entry.get('local_latest') is None or latest_str > entry['local_latest']:
+                entry['local_latest'] = latest_str
+                self._write(index)
+
+    def get_stale_after(self, name):
+        return self.get(name).get('stale_after')
+
+    # Internal Functions
+    def _read(self):
+        """ The parsed index, only read again when the file has been replaced (by this or another process) """
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return dict()
+
+        stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stat_key != self._index_stat:
+            with open(self.filepath) as handle:
+                self._index = json.load(handle)
+            self._index_stat = stat_key
+        return self._index
+
+    def _write(self, index):
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        tmp_fp = f'{self.filepath}.{os.getpid()}.tmp'
+        with open(tmp_fp, 'w') as handle:
+            json.dump(index, handle, indent=2, sort_keys=True)
+        os.replace(tmp_fp, self.filepath)
+
+
+_freshness_indexes = dict()
+
+
+def get_freshness_index(cache_folder):
+    if cache_folder not in _freshness_indexes:
+        _freshness_indexes[cache_folder] = FreshnessIndex(os.path.join(cache_folder, 'freshness.json'))
+    return _freshness_indexes[cache_folder]
+
+
+def probe(dataset):
+    """ Compare the newest remote record_date of dataset with the local one, mark the cache stale if newer """
+    name = type(dataset).__name__
+    index = dataset.freshness_index
+    local_latest = index.get(name).get('local_latest')
+
+    start = time.perf_counter()
+    remote_latest = dataset.get_latest_record_date()
+    duration = time.perf_counter() - start
+    remote_str = None if remote_latest is None else remote_latest.strftime(DATE_FORMAT)
+    is_new = remote_str is not None and (local_latest is None or remote_str > local_latest)
+
+    values = {'remote_latest': remote_str,
+              'probed': datetime.datetime.now().strftime(TIME_FORMAT),
+              'is_new': is_new}
+    if is_new:
+        # Cache files written before this time (epoch seconds) are stale
+        values['stale_after'] = time.time()
+    index.update(name, **values)
+
+    metrics.record_time('freshness.probe', duration)
+    metrics.increment('freshness.probe.new' if is_new else 'freshness.probe.unchanged')
+    return {'dataset': name, 'local_latest': local_latest, 'remote_latest': remote_str,
+            'is_new': is_new, 'duration_s': duration}
+
+
+def probe_all(datasets, max_workers=8):
+    """ Probe every dataset concurrently, a failed probe is reported rather than raised """
+    def _probe(dataset):
+        try:
+            return probe(dataset)
+        except Exception as e:
+            metrics.increment('freshness.probe.errors')
+            return {'dataset': type(dataset).__name__, 'error': repr(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_probe, datasets))
+
+
+if __name__ == '__main__':
+    from src.backend.data.dataset_registry import DATASETS, get_dataset
+
+    for result in probe_all([get_dataset(name) for name in DATASETS]):
+        print(result)
@@ -1,7 +1,17 @@
+import io
+import os
 import datetime
+import functools
+import urllib.parse
 
 import pandas as pd
 from src.backend.data.api_base import DataAPIBase
+from src.backend.data.constants import TENORS
+from src.backend.data.fetch_pipeline import FETCH_ERRORS, get_fetch_pipeline
+from src.backend.instrumentation import metrics, timed
+
+# Can be pointed at a local stand-in server, e.g. for load testing
+HOME_TREASURY_BASE_URL = os.environ.get('MACRO_HOME_TREASURY_URL', 'https://home.treasury.gov')
 
 
 class DailyTreasuryYieldCurve(DataAPIBase):
@@ -9,10 +19,36 @@ class DailyTreasuryYieldCurve(DataAPIBase):
     def __init__(self):
         super().__init__()
         self._from_cache = True
+        self._host = urllib.parse.urlparse(HOME_TREASURY_BASE_URL).netloc
 
     def get_all_data_between_dates(self, start_date, end_date):
+        shared_data = self._get_shared_data(start_date=start_date, end_date=end_date)
+        if shared_data is not None:
+            return shared_data
         return self._request_data(start_date, end_date)
 
+    def is_cached(self, start_date, end_date, fields=None):
+        return all(self._is_in_cache(self._get_unique_str(year), check_freshness=self._can_be_stale(year))
+                   for year in range(start_date.year, end_date.year + 1))
+
+    def iter_data_between_dates(self, start_date, end_date, fields=None, chunk_size=5000):
+        """ Yield the data one year (one cache file) at a time, years that fail to load are skipped """
+        for year in range(start_date.year, end_date.year + 1):
+            try:
+                df = self._request_data_for_year(year)
+            except FETCH_ERRORS as e:
+                self._skip_year(year, error=e)
+                continue
+            df = df.loc[(df[self.date_col_name] >= start_date) & (df[self.date_col_name] <= end_date)]
+            df = df.sort_values(by=self.date_col_name, ascending=True).reset_index(drop=True)
+            if fields is not None:
+                # Tenors that were not published yet in a year (e.g. '4 Mo' before 2022) are left empty
+                df = df.reindex(columns=[self.date_col_name] + [f for f in fields if f != self.date_col_name])
+            yield df
+
+    def get_available_fields(self):
+        return [self.date_col_name] + TENORS
+
     def get_col_data_between_dates(self, start_date, end_date, search_column, search_str):
         data = self.get_all_data_between_dates(start_date=start_date, end_date=end_date)
         assert search_str in data[search_column].unique()
@@ -57,38 +93,100 @@ class DailyTreasuryYieldCurve(DataAPIBase):
         min_year = start_date.year
         max_year = end_date.year
 
+        # Partial results: years that fail to load are skipped, only fail if none loaded
         _all_df = list()
+        error = None
         for year in range(min_year, max_year + 1):
-            _df = self._request_data_for_year(year)
-            _all_df.append(_df)
+            try:
+                _all_df.append(self._request_data_for_year(year))
+            except FETCH_ERRORS as e:
+                error = e
+                self._skip_year(year, error=e)
+
+        if len(_all_df) == 0:
+            raise error
         _all_df = pd.concat(_all_df, axis=0).reset_index(drop=True)
         _all_df = _all_df.sort_values(by=self.date_col_name, ascending=True)
         _all_df = _all_df.loc[(_all_df[self.date_col_name] >= start_date) & (_all_df[self.date_col_name] <= end_date)]
         _all_df = _all_df.reset_index(drop=True)
         return _all_df
 
+    @timed('yield_curve.request_data_for_year')
     def _request_data_for_year(self, year):
 
-        unique_str = f'DailyTreasuryYieldCurve{year}'
+        unique_str = self._get_unique_str(year)
 
         df = None
         if self._from_cache:
-            df = self._load_data_from_cache(unique_str)
+            df = self._load_data_from_cache(unique_str, check_freshness=self._can_be_stale(year))
 
         if df is None:
-            print(f'Requesting data from treasury.gov for {year}')
-            df = pd.read_csv('https://home.treasury.gov/resource-center/data-chart-center/interest-rates/'
-                             'daily-treasury-rates.csv/'
-                             f'{year}/all?type=daily_treasury_yield_curve&field_tdr_date_value={year}&page&_format=csv')
-            self._save_to_cache(unique_str=unique_str, data=df)
+            # A year that a freshness probe marked stale is served as is while it is requested again
+            df = self._fetch_or_serve_stale(key=unique_str,
+                                            fetch=functools.partial(self._fetch_year, year),
+                                            get_stale=functools.partial(self._load_stale_data_from_cache, unique_str))
 
         df = self.format_data(df)
 
         return df
 
+    @staticmethod
+    def _skip_year(year, error):
+        print(f'Warning: Skipping the yield curve for {year}, it could not be requested: {error!r}')
+        metrics.increment('yield_curve.skipped_years')
+
+    def _fetch_year(self, year):
+        print(f'Requesting data from treasury.gov for {year}')
+        df = self._request_csv(f'{year}/all?type=daily_treasury_yield_curve&field_tdr_date_value={year}')
+        self._save_to_cache(unique_str=self._get_unique_str(year), data=df)
+
+        if len(df) > 0:
+            self._record_latest_date(pd.to_datetime(df['Date'], format='%m/%d/%Y').max())
+        self._record_revision(get_df=functools.partial(self.format_data, df),
+                              start_date=self.create_date(year=year, month=1, day=1),
+                              end_date=self.create_date(year=year, month=12, day=31))
+        return df
+
+    def get_latest_record_date(self):
+        # Request only the current month (or the previous one early in a month) rather than the whole year
+        today = datetime.datetime.today()
+        last_month = today.replace(day=1) - datetime.timedelta(days=1)
+        for month in [today, last_month]:
+            month_str = month.strftime('%Y%m')
+            df = self._request_csv(f'all/{month_str}?type=daily_treasury_yield_curve'
+                                   f'&field_tdr_date_value_month={month_str}',
+                                   metric_name='yield_curve.probe')
+            if len(df) > 0:
+                return pd.to_datetime(df['Date'], format='%m/%d/%Y').max().to_pydatetime()
+        return None
+
+    def _request_csv(self, query_str, metric_name='yield_curve.network'):
+        with metrics.timer(metric_name):
+            response = get_fetch_pipeline(self.host).get(f'{HOME_TREASURY_BASE_URL}/resource-center/data-chart-center/'
+                                                         f'interest-rates/daily-treasury-rates.csv/{query_str}'
+                                                         f'&page&_format=csv', timeout=60)
+        metrics.increment(f'{metric_name}.requests')
+        metrics.increment(f'{metric_name}.bytes', len(response.content))
+        return pd.read_csv(io.BytesIO(response.content))
+
+    def _can_be_stale(self, year):
+        # Only years at or after the newest downloaded date can be made stale by new data
+        local_latest = self.freshness_index.get(type(self).__name__).get('local_latest')
+        return local_latest is None or year >= int(local_latest[:4])
+
+    @staticmethod
+    def _get_unique_str(year):
+        return f'DailyTreasuryYieldCurve{year}'
+
+    @timed('yield_curve.format_data')
     def format_data(self, df):
+        metrics.increment('yield_curve.format_data.rows', len(df))
         df = df.rename(columns={'Date': self.date_col_name})
         df[self.date_col_name] = pd.to_datetime(df[self.date_col_name], format='%m/%d/%Y')
+
+        # Every other column is a tenor, an empty year would otherwise give object columns
+        tenors = [col for col in df.columns if col != self.date_col_name]
+        df[tenors] = df[tenors].apply(pd.to_numeric, errors='coerce').astype('float64')
         return df
 
 
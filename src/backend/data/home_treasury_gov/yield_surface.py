@@ -0,0 +1,188 @@
+import os
+import datetime
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from src.backend.data.api_base import CACHE_FOLDER
+from src.backend.data.constants import TENORS
+from src.backend.data.fetch_pipeline import FETCH_ERRORS
+from src.backend.data.file_lock import file_lock
+from src.backend.data.home_treasury_gov.daily_treasury_yield_curve import DailyTreasuryYieldCurve
+from src.backend.instrumentation import metrics, timed
+
+
+class YieldSurface:
+    """
+    A dense (trading day x tenor) float32 matrix of the daily yield curve since start_year.
+
+    The matrix is stored on disk as raw float32 rows (matrix.f32) with a matching array of dates (dates.npy) and is
+    memory-mapped read-only, so the full history is never copied into memory. update() only requests the days
+    after the last stored date and appends them to the file, one process at a time (under a lock file).
+
+    For plotting, get_tile() returns the matrix decimated by 2**level rows (block mean), each level is computed
+    once and kept until the next update.
+
+    """
+
+    def __init__(self, start_year=1990, folder=None):
+        self.start_year = start_year
+        self.dtyc = DailyTreasuryYieldCurve()
+
+        if folder is None:
+            folder = os.path.join(CACHE_FOLDER, 'yield_surface')
+        self.folder = folder
+        self._matrix_fp = os.path.join(folder, 'matrix.f32')
+        self._dates_fp = os.path.join(folder, 'dates.npy')
+
+        self._dates = None
+        self._matrix = None
+        self._tiles = dict()
+
+    @property
+    def dates(self):
+        if self._dates is None:
+            self._load()
+        return self._dates
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            self._load()
+        return self._matrix
+
+    @property
+    def last_date(self):
+        if len(self.dates) == 0:
+            return None
+        return pd.Timestamp(self.dates[-1]).to_pydatetime()
+
+    @timed('yield_surface.update')
+    def update(self, end_date=None):
+        """ Append any trading days after the last stored date, returns the number of new rows """
+        if end_date is None:
+            end_date = datetime.datetime.today()
+
+        # Every worker updates the same files, one at a time. Another worker may have appended rows since this
+        # surface was loaded, so it is loaded again once the lock is held.
+        os.makedirs(self.folder, exist_ok=True)
+        with file_lock(os.path.join(self.folder, 'update.lock')):
+            self._reset()
+
+            if self.last_date is None:
+                start_date = datetime.datetime(year=self.start_year, month=1, day=1)
+            else:
+                start_date = self.last_date + datetime.timedelta(days=1)
+
+            if start_date > end_date:
+                return 0
+
+            # Rows are only ever appended, so stop at the first year that fails rather than leave a gap
+            frames = list()
+            for year in range(start_date.year, end_date.year + 1):
+                try:
+                    frames.append(self.dtyc.get_all_data_between_dates(
+                        start_date=max(start_date, datetime.datetime(year=year, month=1, day=1)),
+                        end_date=min(end_date, datetime.datetime(year=year, month=12, day=31))))
+                except FETCH_ERRORS as e:
+                    print(f'Warning: Yield surface updated up to {year - 1}, {year} could not be requested: {e!r}')
+                    break
+
+            if len(frames) == 0:
+                return 0
+            df = pd.concat(frames, ignore_index=True)
+            if len(df) == 0:
+                return 0
+
+            new_matrix = df.reindex(columns=TENORS).to_numpy(dtype='float32')
+            new_dates = df[self.dtyc.date_col_name].to_numpy(dtype='datetime64[D]')
+
+            old_dates = self.dates
+            self._reset()  # Release the memory map before the file is modified
+
+            # Workers that map the matrix only see rows up to the stored dates, which are never rewritten
+            with open(self._matrix_fp, 'ab') as handle:
+                # Drop rows left over from an interrupted update, then append
+                handle.truncate(len(old_dates) * self._row_bytes)
+                handle.write(np.ascontiguousarray(new_matrix).tobytes())
+
+            # Dates are written after the matrix so a partial write leaves extra matrix rows, which _load() ignores,
+            # and moved into place so other workers never read a partly written file
+            tmp_fp = f'{self._dates_fp}.{os.getpid()}.tmp'
+            with open(tmp_fp, 'wb') as handle:
+                np.save(handle, np.concatenate([old_dates, new_dates]))
+            os.replace(tmp_fp, self._dates_fp)
+
+        metrics.increment('yield_surface.update.rows', len(new_dates))
+        return len(new_dates)
+
+    def get_tile(self, level, start_date=None, end_date=None):
+        """ Return (dates, matrix) decimated by 2**level rows, optionally limited to a date range """
+        if level not in self._tiles:
+            self._tiles[level] = self._decimate(level)
+        dates, matrix = self._tiles[level]
+
+        if start_date is not None or end_date is not None:
+            lo = 0 if start_date is None else np.searchsorted(dates, np.datetime64(start_date, 'D'), side='left')
+            hi = len(dates) if end_date is None else np.searchsorted(dates, np.datetime64(end_date, 'D'), side='right')
+            dates, matrix = dates[lo:hi], matrix[lo:hi]
+        return dates, matrix
+
+    def level_for_range(self, start_date=None, end_date=None, max_rows=1500):
+        """ The smallest decimation level that keeps the visible range under max_rows rows """
+        dates, _ = self.get_tile(level=0, start_date=start_date, end_date=end_date)
+        level = 0
+        while len(dates) / 2 ** level > max_rows:
+            level += 1
+        return level
+
+    # Internal Functions
+    @property
+    def _row_bytes(self):
+        return np.dtype('float32').itemsize * len(TENORS)
+
+    def _load(self):
+        if os.path.exists(self._dates_fp) and os.path.exists(self._matrix_fp):
+            dates = np.load(self._dates_fp)
+            n_rows = min(len(dates), os.path.getsize(self._matrix_fp) // self._row_bytes)
+            self._dates = dates[:n_rows]
+            if n_rows > 0:
+                self._matrix = np.memmap(self._matrix_fp, dtype='float32', mode='r', shape=(n_rows, len(TENORS)))
+            else:
+                self._matrix = np.empty((0, len(TENORS)), dtype='float32')
+        else:
+            self._dates = np.empty(0, dtype='datetime64[D]')
+            self._matrix = np.empty((0, len(TENORS)), dtype='float32')
+
+    def _reset(self):
+        self._dates = None
+        self._matrix = None
+        self._tiles = dict()
+
+    @timed('yield_surface.decimate')
+    def _decimate(self, level):
+        factor = 2 ** level
+        if factor == 1:
+            return self.dates, self.matrix
+
+        n_rows = len(self.dates)
+        n_blocks = -(-n_rows // factor)
+        padded = np.full((n_blocks * factor, len(TENORS)), np.nan, dtype='float32')
+        padded[:n_rows] = self.matrix
+
+        with warnings.catch_warnings():
+            # Tenors that did not exist yet (e.g. 4 Mo before 2022) give all NaN blocks
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            matrix = np.nanmean(padded.reshape(n_blocks, factor, len(TENORS)), axis=1)
+
+        dates = self.dates[::factor]
+        return dates, matrix
+
+
+if __name__ == '__main__':
+    surface = YieldSurface()
+    print(f'Added {surface.update()} days, {len(surface.dates)} days in total')
+
+    _dates, _matrix = surface.get_tile(level=surface.level_for_range(max_rows=500))
+    print(_dates.shape, _matrix.shape)
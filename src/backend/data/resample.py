@@ -0,0 +1,183 @@
+import datetime
+import threading
+
+import pandas as pd
+
+from src.backend.data.constants import DEFAULT_START_DATE
+from src.backend.data.freshness import DATE_FORMAT
+from src.backend.instrumentation import metrics, timed
+
+"""
+Resampled (monthly / quarterly / annual) views of the datasets, see DataAPIBase.get_resampled_data.
+
+A resampled frame is materialized once per (dataset, fields, freq, agg) from DEFAULT_START_DATE and kept in
+memory and in the dataset's cache folder, together with the newest raw date it was built from ('raw_through').
+When new raw rows can exist (the materialization is from an earlier day, a freshness probe marked the dataset
+stale, or newer raw data has been downloaded since, e.g. by a background refresh of older cached data) only the
+raw rows from the start of the last materialized period onwards are requested and resampled, and they replace
+that period and append any new ones. Monthly views never read the full daily data again.
+
+"""
+
+FREQUENCIES = {'monthly': 'M', 'quarterly': 'Q', 'annual': 'Y'}
+AGGREGATIONS = ['last', 'mean', 'sum']
+
+
+def resample(df, date_col, freq, agg, string_cols=()):
+    """
+    Resample df to freq, keeping one row per period end and per combination of string_cols. Every other column is
+    a value column, converted to numbers (NaN if it cannot be) before it is aggregated.
+    """
+    assert freq in FREQUENCIES, f'freq must be one of {", ".join(FREQUENCIES)}'
+    assert agg in AGGREGATIONS, f'agg must be one of {", ".join(AGGREGATIONS)}'
+    if len(df) == 0:
+        return df
+
+    group_cols = [date_col] + [col for col in string_cols if col in df.columns]
+    value_cols = [col for col in df.columns if col not in group_cols]
+
+    # Value columns can arrive as objects, e.g. when an empty frame was concatenated with the data
+    periods = df[date_col].dt.to_period(FREQUENCIES[freq]).dt.to_timestamp(how='end').dt.normalize()
+    df = df.assign(**{date_col: periods},
+                   **{col: pd.to_numeric(df[col], errors='coerce').astype('float64') for col in value_cols})
+
+    df = df.sort_values(by=date_col, kind='stable')
+    df = df.groupby(group_cols, sort=True, observed=True)[value_cols].agg(agg).reset_index()
+
+    # pandas < 2 ignores sort for categorical keys with observed=True (e.g. frames read from the shared store)
+    return df.sort_values(by=group_cols, kind='stable', ignore_index=True)
+
+
+def period_start(date, freq):
+    return pd.Timestamp(date).to_period(FREQUENCIES[freq]).start_time.to_pydatetime()
+
+
+def period_end(date, freq):
+    # Resampled rows are labelled with the end of their period, e.g. the current quarter with its last day
+    return pd.Timestamp(date).to_period(FREQUENCIES[freq]).to_timestamp(how='end').normalize().to_pydatetime()
+
+
+class ResampleCache:
+    """ The materialized resampled frames of every dataset, shared by all instances in the process """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = dict()
+
+    def get(self, dataset, freq, agg='last', fields=None):
+        key, unique_str = self._key(dataset, freq=freq, agg=agg, fields=fields)
+        entry = self._get_entry(dataset, key=key, unique_str=unique_str)
+
+        if entry is None:
+            entry = self._build(dataset, freq=freq, agg=agg, fields=fields)
+        elif self._needs_update(dataset, entry=entry, unique_str=unique_str):
+            entry = self._update(dataset, entry=entry, freq=freq, agg=agg, fields=fields)
+        else:
+            metrics.increment('resample.hits')
+            return entry['df']
+
+        dataset._save_to_cache(unique_str, entry)
+        with self._lock:
+            self._entries[key] = entry
+        return entry['df']
+
+    def is_cached(self, dataset, freq, agg='last', fields=None):
+        """ True if get() would not request any raw data """
+        key, unique_str = self._key(dataset, freq=freq, agg=agg, fields=fields)
+        entry = self._get_entry(dataset, key=key, unique_str=unique_str)
+        return entry is not None and not self._needs_update(dataset, entry=entry, unique_str=unique_str)
+
+    def clear(self):
+        with self._lock:
+            self._entries = dict()
+
+    # Internal Functions
+    @staticmethod
+    def _key(dataset, freq, agg, fields):
+        fields = None if fields is None else tuple(fields)
+        name = type(dataset).__name__
+        unique_str = f'{name}.resampled.{freq}.{agg}.{fields}.{tuple(dataset.string_cols)}'
+        return (dataset._cache_folder, name, fields, freq, agg), unique_str
+
+    def _get_entry(self, dataset, key, unique_str):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            # Freshness is handled by _needs_update, a stale materialization is updated rather than rebuilt
+            entry = dataset._load_data_from_cache(unique_str, check_freshness=False)
+            if entry is not None:
+                with self._lock:
+                    self._entries[key] = entry
+        return entry
+
+    @staticmethod
+    def _needs_update(dataset, entry, unique_str):
+        if entry['built'] < datetime.date.today():
+            return True
+
+        # Raw data newer than the materialization has been downloaded (by any process), e.g. it was built from older
+        # cached data that a background refresh has since replaced
+        local_latest = dataset.freshness_index.get(type(dataset).__name__).get('local_latest')
+        if local_latest is not None and entry['raw_through'] is not None \
+                and local_latest > entry['raw_through'].strftime(DATE_FORMAT):
+            return True
+
+        return dataset._is_stale(dataset._get_cache_path(unique_str))
+
+    @timed('resample.build')
+    def _build(self, dataset, freq, agg, fields):
+        raw = self._get_raw(dataset, start_date=DEFAULT_START_DATE, fields=fields)
+        df = resample(raw, date_col=dataset.date_col_name, freq=freq, agg=agg,
+                      string_cols=dataset.string_cols).reset_index(drop=True)
+        return self._entry(dataset, df=df, raw=raw, raw_through=None)
+
+    @timed('resample.update')
+    def _update(self, dataset, entry, freq, agg, fields):
+        # Only the last materialized period can change, it is resampled again together with any new periods
+        date_col = dataset.date_col_name
+        tail_start = period_start(entry['raw_through'], freq) if entry['raw_through'] is not None \
+            else DEFAULT_START_DATE
+        raw = self._get_raw(dataset, start_date=tail_start, fields=fields)
+
+        if len(raw) == 0:
+            return self._entry(dataset, df=entry['df'], raw=raw, raw_through=entry['raw_through'])
+
+        head = entry['df'][entry['df'][date_col] < tail_start]
+        tail = resample(raw, date_col=date_col, freq=freq, agg=agg, string_cols=dataset.string_cols)
+        df = pd.concat([head, tail], ignore_index=True)
+        return self._entry(dataset, df=df, raw=raw, raw_through=entry['raw_through'])
+
+    @staticmethod
+    def _get_raw(dataset, start_date, fields):
+        end_date = datetime.datetime.today()
+
+        # Workers read the frame the loader published to the shared store rather than each loading the raw data
+        date_col = dataset.date_col_name
+        shared_fields = None if fields is None else [date_col] + [f for f in fields if f != date_col]
+        raw = dataset._get_shared_data(start_date=start_date, end_date=end_date, fields=shared_fields)
+
+        if raw is None:
+            frames = list(dataset.iter_data_between_dates(start_date=start_date, end_date=end_date,
+                                                          fields=dataset._source_fields(fields)))
+            if len(frames) == 0:
+                return pd.DataFrame(columns=[date_col])
+            raw = pd.concat(frames, ignore_index=True)
+        metrics.increment('resample.raw_rows', len(raw))
+        return raw
+
+    @staticmethod
+    def _entry(dataset, df, raw, raw_through):
+        if len(raw) > 0:
+            raw_through = raw[dataset.date_col_name].max().to_pydatetime()
+        return {'df': df, 'raw_through': raw_through, 'built': datetime.date.today()}
+
+
+resample_cache = ResampleCache()
+
+
+if __name__ == '__main__':
+    from src.backend.data.fiscaldata_treasury_gov.debt_to_the_penny import DebtToThePenny
+
+    debt_to_penny = DebtToThePenny()
+    print(debt_to_penny.get_resampled_data(freq='monthly', agg='last').tail())
+    print(debt_to_penny.get_resampled_data(freq='quarterly', agg='mean').tail())
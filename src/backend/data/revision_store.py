@@ -0,0 +1,324 @@
+import os
+import pickle
+import hashlib
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.backend.data.api_base import CACHE_FOLDER
+from src.backend.data.file_lock import file_lock
+from src.backend.instrumentation import metrics, timed
+
+
+class RevisionStore:
+    """
+    Versioned history of a dataset, stored as one compact delta per refresh.
+
+    Rows are identified by a hash of their values and grouped into monthly partitions of the date column. On each
+    record() the per-partition hashes are compared with the previous refresh, only partitions whose hash changed
+    are diffed, and the delta (rows added / row hashes removed) is appended. The first record() stores the full
+    frame as the base.
+
+    as_of(fetch_time) replays the deltas up to fetch_time to rebuild the dataset as it was seen at that time.
+
+        store = RevisionStore('interest_expense')
+        store.record_dataset(InterestOnDebtOutstanding(), start_date, end_date)
+        revised = store.revisions()
+
+    The datasets also record every download of their default fields in a store named after the dataset class, in
+    the background (see DataAPIBase._record_revision and RevisionRecorder).
+
+    """
+
+    def __init__(self, name, date_col='date', folder=None):
+        if folder is None:
+            folder = os.path.join(CACHE_FOLDER, 'revisions')
+        self.name = name
+        self.date_col = date_col
+        self._filepath = os.path.join(folder, f'{name}.pickle')
+
+        self._revisions = list()
+        self._partition_hashes = dict()
+        self._row_hashes = dict()
+        self._file_stat = None
+        self._load()
+
+    def record(self, df, fetch_time=None, start_date=None, end_date=None):
+        """
+        Record a refresh of the dataset and return the delta that was stored, None if nothing changed (nothing is
+        stored then).
+
+        A refresh of only start_date - end_date leaves the partitions outside that range as they are, and the
+        months it covers in part can gain rows but not lose them.
+        """
+        return self.record_all([{'df': df, 'fetch_time': fetch_time, 'start_date': start_date,
+                                 'end_date': end_date}])[0]
+
+    @timed('revision_store.record')
+    def record_all(self, refreshes):
+        """ Record refreshes (dicts of record()'s arguments) in order and save once, returns their deltas """
+        # Every worker and the loader process record into the same file
+        with file_lock(f'{self._filepath}.lock'):
+            self._load()
+            revisions = [self._record(**refresh) for refresh in refreshes]
+            if any(revision is not None for revision in revisions):
+                self._save()
+        return revisions
+
+    def _record(self, df, fetch_time=None, start_date=None, end_date=None):
+        if fetch_time is None:
+            fetch_time = datetime.datetime.now()
+
+        if len(self._revisions) > 0:
+            assert fetch_time >= self._revisions[-1]['fetch_time'], 'Revisions must be recorded in time order'
+
+        df = df.reset_index(drop=True)
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+        # Identical rows are told apart by their occurrence (the first keeps its plain hash), so the hashes compare
+        # as multisets and duplicates are added and removed one at a time
+        occurrence = pd.Series(row_hashes).groupby(row_hashes).cumcount().to_numpy(dtype='uint64')
+        row_hashes = row_hashes + occurrence * np.uint64(0x9E3779B97F4A7C15)
+        partitions = df[self.date_col].dt.to_period('M').astype(str).to_numpy()
+
+        new_row_hashes = dict()
+        new_partition_hashes = dict()
+        for partition in np.unique(partitions):
+            hashes = np.sort(row_hashes[partitions == partition])
+            new_row_hashes[partition] = hashes
+            new_partition_hashes[partition] = hashlib.sha1(hashes.tobytes()).hexdigest()
+
+        empty = np.empty(0, dtype='uint64')
+        for partition in self._get_partial_partitions(start_date, end_date) & set(new_row_hashes):
+            hashes = np.union1d(self._row_hashes.get(partition, empty), new_row_hashes[partition])
+            new_row_hashes[partition] = hashes
+            new_partition_hashes[partition] = hashlib.sha1(hashes.tobytes()).hexdigest()
+
+        in_range = [p for p in set(new_partition_hashes) | set(self._partition_hashes)
+                    if self._is_in_range(p, start_date, end_date)]
+        changed = sorted(p for p in in_range if new_partition_hashes.get(p) != self._partition_hashes.get(p))
+        if len(changed) == 0:
+            metrics.increment('revision_store.record.unchanged')
+            return None
+
+        added_mask = np.zeros(len(df), dtype=bool)
+        removed = list()
+        revised = list()
+        for partition in changed:
+            old_hashes = self._row_hashes.get(partition, empty)
+            new_hashes = new_row_hashes.get(partition, empty)
+
+            in_partition = partitions == partition
+            added_mask |= in_partition & ~np.isin(row_hashes, old_hashes)
+            removed_hashes = old_hashes[~np.isin(old_hashes, new_hashes)]
+            if len(removed_hashes) > 0:
+                removed.append(removed_hashes)
+                revised.append(partition)
+
+        added = df[added_mask].assign(_row_hash=row_hashes[added_mask])
+
+        revision = {'fetch_time': fetch_time,
+                    'changed_partitions': changed,
+                    'revised_partitions': revised,
+                    'added': added,
+                    'removed': np.concatenate(removed) if len(removed) > 0 else empty}
+
+        self._revisions.append(revision)
+        for partition in in_range:
+            self._partition_hashes.pop(partition, None)
+            self._row_hashes.pop(partition, None)
+        self._partition_hashes.update(new_partition_hashes)
+        self._row_hashes.update(new_row_hashes)
+
+        metrics.increment('revision_store.record.added_rows', len(added))
+        metrics.increment('revision_store.record.removed_rows', len(revision['removed']))
+        return revision
+
+    def record_dataset(self, dataset, start_date, end_date, fetch_time=None):
+        """
+        Re-request the dataset and record it, see record(). The cache (which is refreshed), the shared store and older cached data
+        are bypassed, and so is the dataset's own revision store.
+        """
+        settings = (dataset._from_cache, dataset._use_shared_store, dataset._serve_stale, dataset._record_revisions)
+        dataset._from_cache = False
+        dataset._use_shared_store = False
+        dataset._serve_stale = False
+        dataset._record_revisions = False
+        try:
+            df = dataset.get_all_data_between_dates(start_date=start_date, end_date=end_date)
+        finally:
+            dataset._from_cache, dataset._use_shared_store, dataset._serve_stale, dataset._record_revisions = settings
+        return self.record(df=df, fetch_time=fetch_time, start_date=start_date, end_date=end_date)
+
+    @timed('revision_store.as_of')
+    def as_of(self, fetch_time=None):
+        """ The dataset as seen at fetch_time (latest if None) """
+        frames = list()
+        for revision in self._revisions:
+            if fetch_time is not None and revision['fetch_time'] > fetch_time:
+                break
+
+            if len(revision['removed']) > 0:
+                frames = [f[~f['_row_hash'].isin(revision['removed'])] for f in frames]
+            if len(revision['added']) > 0:
+                frames.append(revision['added'])
+
+        if len(frames) == 0:
+            return None
+
+        df = pd.concat(frames).drop(columns=['_row_hash'])
+        return df.sort_values(by=self.date_col, kind='stable').reset_index(drop=True)
+
+    def revisions(self):
+        """ Summary of every recorded refresh """
+        return pd.DataFrame({'fetch_time': [r['fetch_time'] for r in self._revisions],
+                             'changed_partitions': [r['changed_partitions'] for r in self._revisions],
+                             'added_rows': [len(r['added']) for r in self._revisions],
+                             'removed_rows': [len(r['removed']) for r in self._revisions]})
+
+    def revised_partitions(self, since=None):
+        """ Partitions whose existing rows were changed or removed (i.e. revised, not just appended) """
+        revised = set()
+        for revision in self._revisions:
+            if since is not None and revision['fetch_time'] <= since:
+                continue
+            revised.update(revision['revised_partitions'])
+        return sorted(revised)
+
+    # Internal Functions
+    @staticmethod
+    def _is_in_range(partition, start_date, end_date):
+        # Partitions are formatted as 'YYYY-MM', so they compare as strings
+        return (start_date is None or partition >= start_date.strftime('%Y-%m')) and \
+            (end_date is None or partition <= end_date.strftime('%Y-%m'))
+
+    @staticmethod
+    def _get_partial_partitions(start_date, end_date):
+        """ Months that start_date - end_date covers only in part, an end date of today covers its month """
+        partial = set()
+        if start_date is not None and start_date.day != 1:
+            partial.add(start_date.strftime('%Y-%m'))
+        if end_date is not None and end_date.date() < datetime.date.today() and \
+                (end_date + datetime.timedelta(days=1)).month == end_date.month:
+            partial.add(end_date.strftime('%Y-%m'))
+        return partial
+
+    def _load(self):
+        """ Load the stored revisions, unless the file is unchanged since it was last loaded or saved """
+        try:
+            stat = os.stat(self._filepath)
+        except FileNotFoundError:
+            return
+
+        file_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_stat == self._file_stat:
+            return
+
+        with open(self._filepath, 'rb') as handle:
+            state = pickle.load(handle)
+        self._revisions = state['revisions']
+        self._partition_hashes = state['partition_hashes']
+        self._row_hashes = state['row_hashes']
+        self._file_stat = file_stat
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self._filepath), exist_ok=True)
+        state = {'revisions': self._revisions,
+                 'partition_hashes': self._partition_hashes,
+                 'row_hashes': self._row_hashes}
+
+        tmp_fp = f'{self._filepath}.{os.getpid()}.tmp'
+        with open(tmp_fp, 'wb') as handle:
+            pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fp, self._filepath)
+
+        stat = os.stat(self._filepath)
+        self._file_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+_revision_stores = dict()
+_revision_stores_lock = threading.Lock()
+
+
+def get_revision_store(name, date_col='date', folder=None):
+    """ One RevisionStore per name and folder in each process """
+    with _revision_stores_lock:
+        if (name, folder) not in _revision_stores:
+            _revision_stores[(name, folder)] = RevisionStore(name, date_col=date_col, folder=folder)
+        return _revision_stores[(name, folder)]
+
+
+class RevisionRecorder:
+    """
+    Records the datasets' downloads on a background thread, so a download on the request path only queues them.
+    The thread waits delay seconds before it records, and the refreshes queued for a store by then (e.g. every year
+    of a yield curve backfill) are recorded together, with one load and one save.
+    """
+
+    def __init__(self, delay=2.0):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._pending = list()
+        self._n_queued = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='revisions')
+
+    def submit(self, get_store, get_df, start_date, end_date):
+        """ Queue the refresh get_df() of start_date - end_date for the store get_store() """
+        with self._lock:
+            self._pending.append((get_store, get_df, start_date, end_date))
+            self._n_queued += 1
+        self._executor.submit(self._run)
+
+    def wait(self, timeout=None):
+        """ Block until every queued refresh is recorded, returns False on timeout """
+        start = time.time()
+        while self._n_queued > 0:
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # Internal Functions
+    def _run(self):
+        try:
+            with self._lock:
+                if len(self._pending) == 0:
+                    # Recorded together with an earlier submit
+                    return
+            time.sleep(self.delay)
+            with self._lock:
+                pending, self._pending = self._pending, list()
+
+            refreshes = dict()
+            for get_store, get_df, start_date, end_date in pending:
+                refreshes.setdefault(get_store(), list()).append((get_df, start_date, end_date))
+
+            for store, store_refreshes in refreshes.items():
+                try:
+                    store.record_all([{'df': get_df(), 'start_date': start_date, 'end_date': end_date}
+                                      for get_df, start_date, end_date in store_refreshes])
+                except Exception as e:
+                    # The downloads themselves succeeded, so they are served either way
+                    print(f'Warning: The revisions of {store.name} could not be recorded: {e!r}')
+                    metrics.increment('revision_store.errors')
+        finally:
+            with self._lock:
+                self._n_queued -= 1
+
+
+revision_recorder = RevisionRecorder()
+
+
+if __name__ == '__main__':
+    from src.backend.data.fiscaldata_treasury_gov.interest_on_debt_outstanding import InterestOnDebtOutstanding
+
+    store = RevisionStore('interest_expense')
+    store.record_dataset(InterestOnDebtOutstanding(),
+                         start_date=datetime.datetime(year=2010, month=1, day=1),
+                         end_date=datetime.datetime.today())
+    print(store.revisions())
+    print(store.revised_partitions())
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import datetime
+import threading
+
+from src.backend.data.constants import DEFAULT_START_DATE
+from src.backend.data.dataset_registry import DATASETS, get_dataset
+from src.backend.data.fetch_pipeline import FETCH_ERRORS
+from src.backend.data.freshness import probe_all
+from src.backend.instrumentation import metrics, timed
+
+"""
+Shared, memory-mapped dataset store for running several Dash workers.
+
+One loader process requests every dataset and publishes the formatted frames, sorted by date, as columnar .npy
+files (one per column, string columns as categorical codes) under MACRO_SHARED_STORE, ideally on a tmpfs such as
+/dev/shm. Workers map the columns read-only, so the data is loaded once and its pages are shared by all workers
+through the page cache. Reads are sliced by date rather than masked, so they stay views of the mapped columns.
+
+Each publish writes a new version folder and then atomically swaps the dataset's CURRENT file and touches the
+store's VERSION file. Workers stat VERSION (check_for_updates) and remap any dataset whose CURRENT changed, then
+notify their listeners, e.g. to drop cached page layouts.
+
+    python -m src.backend.data.shared_store publish --watch 3600
+
+"""
+
+# application.py imports this module, so numpy and pandas are only imported once a dataset is published or
+# mapped (see src/import_budget.py)
+SHARED_STORE_FOLDER = os.environ.get('MACRO_SHARED_STORE')
+
+
+class SharedDatasetStore:
+
+    def __init__(self, folder, keep_versions=2):
+        self.folder = folder
+        self.keep_versions = keep_versions
+
+        self._lock = threading.Lock()
+        self._mapped = dict()
+        self._listeners = list()
+        self._version_mtime = None
+
+    # --- Loader side
+    @timed('shared_store.publish')
+    def publish(self, name, df):
+        import numpy as np
+        import pandas as pd
+
+        version = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+        version_folder = os.path.join(self.folder, name, version)
+        os.makedirs(version_folder)
+
+        columns = list()
+        for i, col in enumerate(df.columns):
+            if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+                np.save(os.path.join(version_folder, f'{i}.npy'), df[col].to_numpy(), allow_pickle=False)
+            else:
+                # Strings are stored as categorical codes (-1 marks a null) plus their categories, so the codes can
+                # be memory-mapped too and only the categories are loaded by each worker
+                categorical = pd.Categorical(df[col])
+                np.save(os.path.join(version_folder, f'{i}.npy'), categorical.codes, allow_pickle=False)
+                np.save(os.path.join(version_folder, f'{i}.categories.npy'),
+                        categorical.categories.to_numpy(dtype=str), allow_pickle=False)
+            columns.append(col)
+
+        with open(os.path.join(version_folder, 'columns.json'), 'w') as handle:
+            json.dump(columns, handle)
+
+        self._write_atomic(os.path.join(self.folder, name, 'CURRENT'), version)
+        self._write_atomic(os.path.join(self.folder, 'VERSION'), version)
+        self._remove_old_versions(name)
+
+        metrics.increment('shared_store.publish.rows', len(df))
+        return version
+
+    # --- Worker side
+    def open(self, name, columns=None):
+        """
+        The published frame for name (only the given columns, if any) backed by read-only memory maps, None if it
+        has not been published or lacks one of the columns.
+
+        The frame is built from the mapped columns on each call. Selecting columns from a built frame would copy
+        them on pandas < 2 (a take), building it from the selected columns keeps every column a view.
+        """
+        import pandas as pd
+
+        version = self._read(os.path.join(self.folder, name, 'CURRENT'))
+        if version is None:
+            return None
+
+        with self._lock:
+            mapped = self._mapped.get(name)
+        if mapped is None or mapped[0] != version:
+            mapped = (version, self._map(name, version))
+            with self._lock:
+                self._mapped[name] = mapped
+            metrics.increment('shared_store.map')
+
+        data = mapped[1]
+        if columns is None:
+            columns = list(data)
+        elif not set(columns).issubset(data):
+            return None
+        # copy=False also keeps pandas from consolidating the columns into (copied) blocks
+        return pd.DataFrame({col: data[col] for col in columns}, copy=False)
+
+    def add_listener(self, callback):
+        """ callback() is called after check_for_updates() finds a new publish """
+        self._listeners.append(callback)
+
+    def check_for_updates(self):
+        """ Cheap (one stat) check for new publishes, drops stale mappings and notifies listeners """
+        try:
+            mtime = os.stat(os.path.join(self.folder, 'VERSION')).st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+        if mtime == self._version_mtime:
+            return False
+
+        first_check = self._version_mtime is None
+        self._version_mtime = mtime
+        if first_check:
+            return False
+
+        with self._lock:
+            self._mapped = dict()
+        for callback in self._listeners:
+            callback()
+        metrics.increment('shared_store.updates')
+        return True
+
+    # Internal Functions
+    def _map(self, name, version):
+        """ The columns of a published version, as read-only memory maps (categoricals for string columns) """
+        import numpy as np
+        import pandas as pd
+
+        version_folder = os.path.join(self.folder, name, version)
+        with open(os.path.join(version_folder, 'columns.json')) as handle:
+            columns = json.load(handle)
+
+        data = dict()
+        for i, col in enumerate(columns):
+            values = np.load(os.path.join(version_folder, f'{i}.npy'), mmap_mode='r')
+            categories_fp = os.path.join(version_folder, f'{i}.categories.npy')
+            if os.path.exists(categories_fp):
+                values = pd.Categorical.from_codes(values, categories=np.load(categories_fp))
+            data[col] = values
+        return data
+
+    def _remove_old_versions(self, name):
+        # Old versions are unlinked, workers that still map them keep their pages until they remap
+        versions = sorted(v for v in os.listdir(os.path.join(self.folder, name)) if v != 'CURRENT')
+        for version in versions[:-self.keep_versions]:
+            shutil.rmtree(os.path.join(self.folder, name, version), ignore_errors=True)
+
+    @staticmethod
+    def _read(filepath):
+        try:
+            with open(filepath) as handle:
+                return handle.read().strip()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_atomic(filepath, content):
+        tmp_fp = f'{filepath}.{os.getpid()}.tmp'
+        with open(tmp_fp, 'w') as handle:
+            handle.write(content)
+        os.replace(tmp_fp, filepath)
+
+
+_shared_store = None
+
+
+def get_shared_store():
+    """ The process wide store, or None when MACRO_SHARED_STORE is not set """
+    global _shared_store
+    if SHARED_STORE_FOLDER is None:
+        return None
+    if _shared_store is None:
+        _shared_store = SharedDatasetStore(SHARED_STORE_FOLDER)
+    return _shared_store
+
+
+def publish_all(store, names=tuple(DATASETS), only_new=False):
+    """ Publish the datasets, with only_new=True datasets whose freshness probe finds no new data are skipped """
+    datasets = {name: get_dataset(name) for name in names}
+
+    if only_new:
+        results = probe_all(list(datasets.values()))
+        datasets = {name: dataset for (name, dataset), result in zip(datasets.items(), results)
+                    if result.get('is_new')}
+
+    for name, dataset in datasets.items():
+        # The loader reads the datasets directly, never from the store it is publishing to, and waits for fresh
+        # data rather than publishing older cached data
+        dataset._use_shared_store = False
+        dataset._serve_stale = False
+        try:
+            df = dataset.get_all_data_between_dates(start_date=DEFAULT_START_DATE, end_date=datetime.datetime.today())
+        except FETCH_ERRORS as e:
+            # The previous publish (if any) stays current, the other datasets are still published
+            print(f'Warning: Could not publish {name}: {e!r}')
+            metrics.increment('shared_store.publish.errors')
+            continue
+
+        # Datasets are published under their class name and sorted by date, which is how DataAPIBase reads them
+        df = df.sort_values(by=dataset.date_col_name, kind='stable').reset_index(drop=True)
+        store.publish(type(dataset).__name__, df)
+        print(f'Published {name} ({len(df)} rows)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish datasets to the shared store')
+    parser.add_argument('command', choices=['publish'])
+    parser.add_argument('--folder', default=SHARED_STORE_FOLDER)
+    parser.add_argument('--watch', type=float, default=None, help='Republish every WATCH seconds')
+    parser.add_argument('--skip-initial', action='store_true', help='Wait WATCH seconds before the first publish')
+    args = parser.parse_args()
+
+    assert args.folder is not None, 'Set MACRO_SHARED_STORE or pass --folder'
+    store = SharedDatasetStore(args.folder)
+
+    only_new = False
+    if args.skip_initial and args.watch is not None:
+        time.sleep(args.watch)
+        only_new = True
+
+    while True:
+        publish_all(store, only_new=only_new)
+        if args.watch is None:
+            break
+
+        # After the first publish only datasets with new data are published again
+        only_new = True
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
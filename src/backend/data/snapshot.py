@@ -0,0 +1,164 @@
+import io
+import os
+import json
+import hashlib
+import tarfile
+import argparse
+import datetime
+
+from src.backend.data.api_base import CACHE_FOLDER
+from src.backend.data.file_lock import file_lock
+from src.backend.instrumentation import metrics, timed
+
+"""
+Offline snapshots of the dataset cache.
+
+A snapshot is a gzip compressed tar archive of every cache file plus a 'manifest.json' holding the snapshot
+format version, creation time and the sha256 / size of each file. Nodes can import a snapshot on boot (set
+MACRO_SNAPSHOT) and start without hitting the Treasury endpoints, only data missing from the snapshot is requested.
+
+    python -m src.backend.data.snapshot export /artifacts/cache_snapshot.tar.gz
+    python -m src.backend.data.snapshot import /artifacts/cache_snapshot.tar.gz
+
+"""
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+CACHE_FILE_EXTENSIONS = ('.pickle',)
+
+
+def _sha256_file(filepath):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _list_cache_files(cache_folder):
+    if not os.path.isdir(cache_folder):
+        return list()
+    return sorted(f for f in os.listdir(cache_folder) if f.endswith(CACHE_FILE_EXTENSIONS))
+
+
+@timed('snapshot.export')
+def export_snapshot(snapshot_fp, cache_folder=CACHE_FOLDER):
+    cache_files = _list_cache_files(cache_folder)
+    if len(cache_files) == 0:
+        print(f'Warning: No cache files found in {cache_folder}')
+
+    manifest = dict()
+    manifest['format_version'] = SNAPSHOT_FORMAT_VERSION
+    manifest['created'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    manifest['files'] = dict()
+    for name in cache_files:
+        filepath = os.path.join(cache_folder, name)
+        manifest['files'][name] = {'sha256': _sha256_file(filepath),
+                                   'size': os.path.getsize(filepath)}
+
+    manifest_bytes = json.dumps(manifest, indent=2).encode()
+
+    tmp_fp = f'{snapshot_fp}.tmp'
+    with tarfile.open(tmp_fp, 'w:gz') as tar:
+        # The manifest is written first so import can validate before extracting anything
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(manifest_bytes)
+        tar.addfile(info, io.BytesIO(manifest_bytes))
+
+        for name in cache_files:
+            tar.add(os.path.join(cache_folder, name), arcname=name)
+    os.replace(tmp_fp, snapshot_fp)
+
+    print(f'Exported {len(cache_files)} cache files to {snapshot_fp}')
+    return manifest
+
+
+@timed('snapshot.import')
+def import_snapshot(snapshot_fp, cache_folder=CACHE_FOLDER, overwrite=False):
+    """
+    Import a snapshot into the cache folder, returns the number of files written.
+
+    Existing cache files are kept unless overwrite=True, so a node that has already refreshed some datasets
+    does not roll them back to the snapshot. Every file is checked against the manifest checksum before it is
+    moved into place.
+
+    """
+    os.makedirs(cache_folder, exist_ok=True)
+
+    with tarfile.open(snapshot_fp, 'r:gz') as tar:
+        manifest = json.load(tar.extractfile(MANIFEST_NAME))
+
+        if manifest['format_version'] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f'Unsupported snapshot format version: {manifest["format_version"]}')
+
+        n_written = 0
+        for name, file_info in manifest['files'].items():
+            # Manifest names are flat cache file names, reject anything that could escape the cache folder
+            if os.path.basename(name) != name or not name.endswith(CACHE_FILE_EXTENSIONS):
+                raise ValueError(f'Invalid file name in snapshot: {name}')
+
+            target_fp = os.path.join(cache_folder, name)
+            if os.path.exists(target_fp) and not overwrite:
+                continue
+
+            data = tar.extractfile(name).read()
+            if hashlib.sha256(data).hexdigest() != file_info['sha256']:
+                raise ValueError(f'Checksum mismatch for {name} in {snapshot_fp}')
+
+            # Other processes may be importing into the same cache folder, never share a tmp file with them
+            tmp_fp = f'{target_fp}.{os.getpid()}.tmp'
+            with open(tmp_fp, 'wb') as handle:
+                handle.write(data)
+            os.replace(tmp_fp, target_fp)
+
+            n_written += 1
+            metrics.increment('snapshot.import.bytes', len(data))
+
+    print(f'Imported {n_written} of {len(manifest["files"])} cache files from {snapshot_fp} '
+          f'(created {manifest["created"]})')
+    return n_written
+
+
+def import_snapshot_on_boot(cache_folder=CACHE_FOLDER):
+    """
+    Import the snapshot at $MACRO_SNAPSHOT (if set and present) into the cache.
+
+    Runs when application.py is imported, and in the gunicorn master (see gunicorn.conf.py) before it publishes.
+    It holds a lock on the cache folder, so processes that boot together import one after the other and the later
+    ones find the files already in place.
+
+    """
+    snapshot_fp = os.environ.get('MACRO_SNAPSHOT')
+    if snapshot_fp is None:
+        return 0
+
+    if not os.path.exists(snapshot_fp):
+        print(f'Warning: Snapshot {snapshot_fp} not found, starting with the existing cache')
+        return 0
+
+    with file_lock(os.path.join(cache_folder, 'snapshot.lock')):
+        return import_snapshot(snapshot_fp=snapshot_fp, cache_folder=cache_folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export / import snapshots of the dataset cache')
+    parser.add_argument('--cache-folder', default=CACHE_FOLDER)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export the cache to a snapshot archive')
+    export_parser.add_argument('snapshot_fp')
+
+    import_parser = subparsers.add_parser('import', help='Import a snapshot archive into the cache')
+    import_parser.add_argument('snapshot_fp')
+    import_parser.add_argument('--overwrite', action='store_true', help='Replace existing cache files')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_snapshot(snapshot_fp=args.snapshot_fp, cache_folder=args.cache_folder)
+    else:
+        import_snapshot(snapshot_fp=args.snapshot_fp, cache_folder=args.cache_folder, overwrite=args.overwrite)
+
+
+if __name__ == '__main__':
+    main()
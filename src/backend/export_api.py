@@ -0,0 +1,256 @@
+import io
+import datetime
+import functools
+import threading
+
+import flask
+
+from src.backend.data import dataset_registry
+from src.backend.data.constants import DEFAULT_START_DATE
+from src.backend.data.dataset_registry import DATASETS
+from src.backend.data.resample import AGGREGATIONS, FREQUENCIES, period_end, resample
+from src.backend.instrumentation import metrics, timed
+
+"""
+Read-only export API for the backend datasets.
+
+    GET /datasets
+    GET /datasets/<name>?start=2020-01-01&end=2022-12-31&fields=a,b&freq=monthly&agg=last&format=csv
+    GET /projected_interest?debt_type=T-Bills&freq=annual&format=arrow
+
+    freq:   daily (default, the dataset's native resolution), monthly, quarterly or annual
+    agg:    last (default), mean or sum - how rows are rolled up for monthly / quarterly / annual
+    format: csv (default), json or arrow (Arrow IPC stream, requires pyarrow)
+
+Native resolution responses are streamed chunk by chunk from the dataset cache (or page by page while they are
+requested), so the full DataFrame is never built. Requested fields are checked before the response starts.
+Rolled-up frames are the datasets' resampled views (DataAPIBase.get_resampled_data), materialized once per
+(dataset, fields, freq, agg) and updated incrementally, precompute_rollups() warms them for every dataset.
+
+"""
+
+export_api = flask.Blueprint('export_api', __name__)
+
+FORMATS = {'csv': 'text/csv', 'json': 'application/json', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+
+@functools.lru_cache(maxsize=None)
+def get_dataset(name):
+    return dataset_registry.get_dataset(name)
+
+
+class RollupCache:
+    """ In memory cache of rolled-up frames that are not datasets, keyed by (source, filter, freq, agg) """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = dict()
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._frames:
+                metrics.increment('export_api.rollup_cache.hits')
+                return self._frames[key]
+
+        frame = build()
+        with self._lock:
+            self._frames[key] = frame
+        return frame
+
+    def clear(self):
+        with self._lock:
+            self._frames = dict()
+
+
+rollup_cache = RollupCache()
+
+
+@functools.lru_cache(maxsize=None)
+def get_projected_interest():
+    from src.backend.analysis.projected_interest_batch import ProjectedInterestBatch
+    return ProjectedInterestBatch().df
+
+
+def precompute_rollups(names=tuple(DATASETS), freqs=('monthly', 'quarterly', 'annual'), agg='last'):
+    for name in names:
+        for freq in freqs:
+            _get_rollup(name=name, fields=None, freq=freq, agg=agg)
+
+
+# --- Routes
+@export_api.route('/datasets')
+def list_datasets():
+    return flask.jsonify({name: {'default_fields': getattr(get_dataset(name), 'default_fields', None)}
+                          for name in DATASETS})
+
+
+@export_api.route('/datasets/<name>')
+@timed('export_api.get_dataset')
+def get_dataset_data(name):
+    if name not in DATASETS:
+        flask.abort(404, f'Unknown dataset: {name}')
+
+    args = _parse_args()
+    dataset = get_dataset(name)
+    _check_fields(fields=dataset._source_fields(args['fields']), available=dataset.get_available_fields())
+    if args['freq'] == 'daily':
+        frames = dataset.iter_data_between_dates(start_date=args['start'], end_date=args['end'],
+                                                 fields=dataset._source_fields(args['fields']))
+    else:
+        df = _get_rollup(name=name, fields=args['fields'], freq=args['freq'], agg=args['agg'])
+        frames = [_filter_frame(df, date_col='date', start=args['start'], end=args['end'], fields=args['fields'],
+                                freq=args['freq'])]
+
+    return _stream_response(frames=frames, fmt=args['format'], filename=name)
+
+
+@export_api.route('/projected_interest')
+@timed('export_api.get_projected_interest')
+def get_projected_interest_data():
+    args = _parse_args(default_agg='sum')
+    df = get_projected_interest()
+
+    debt_type = flask.request.args.get('debt_type')
+    if debt_type is not None:
+        df = df[df['debt_type'] == debt_type]
+
+    # The projected interest is monthly, so only quarterly and annual roll it up
+    if args['freq'] in ['quarterly', 'annual']:
+        key = ('projected_interest', debt_type, args['freq'], args['agg'])
+        df = rollup_cache.get(key, lambda: resample(df, date_col='date', freq=args['freq'], agg=args['agg'],
+                                                    string_cols=['debt_type']))
+
+    _check_fields(fields=args['fields'], available=list(df.columns))
+    df = _filter_frame(df, date_col='date', start=args['start'], end=args['end'], fields=args['fields'],
+                       freq=None if args['freq'] == 'daily' else args['freq'])
+    return _stream_response(frames=[df], fmt=args['format'], filename='projected_interest')
+
+
+# --- Internal Functions
+def _parse_args(default_agg='last'):
+    request_args = flask.request.args
+
+    def _parse_date(key, default):
+        if key not in request_args:
+            return default
+        try:
+            return datetime.datetime.strptime(request_args[key], '%Y-%m-%d')
+        except ValueError:
+            flask.abort(400, f'{key} must be formatted as YYYY-MM-DD')
+
+    args = dict()
+    args['start'] = _parse_date('start', DEFAULT_START_DATE)
+    args['end'] = _parse_date('end', datetime.datetime.today())
+    args['fields'] = request_args['fields'].split(',') if 'fields' in request_args else None
+    args['freq'] = request_args.get('freq', 'daily')
+    args['agg'] = request_args.get('agg', default_agg)
+    args['format'] = request_args.get('format', 'csv')
+
+    if args['freq'] not in ['daily'] + list(FREQUENCIES):
+        flask.abort(400, f'freq must be one of daily, {", ".join(FREQUENCIES)}')
+    if args['agg'] not in AGGREGATIONS:
+        flask.abort(400, f'agg must be one of {", ".join(AGGREGATIONS)}')
+    if args['format'] not in FORMATS:
+        flask.abort(400, f'format must be one of {", ".join(FORMATS)}')
+    return args
+
+
+def _check_fields(fields, available):
+    # Unknown fields would otherwise only fail once the response has started streaming
+    if fields is None or available is None:
+        return
+    unknown = [f for f in fields if f not in available]
+    if len(unknown) > 0:
+        flask.abort(400, f'Unknown fields: {", ".join(unknown)}, fields must be among {", ".join(available)}')
+
+
+def _get_rollup(name, fields, freq, agg):
+    dataset = get_dataset(name)
+    if fields is not None:
+        fields = [f for f in fields if f != dataset.date_col_name]
+    return dataset.get_resampled_data(freq=freq, agg=agg, fields=fields)
+
+
+def _filter_frame(df, date_col, start, end, fields, freq=None):
+    if freq is not None:
+        end = period_end(end, freq)
+    df = df[(df[date_col] >= start) & (df[date_col] <= end)]
+    if fields is not None:
+        df = df[[date_col] + [f for f in fields if f != date_col and f in df.columns]]
+    return df
+
+
+def _stream_response(frames, fmt, filename):
+    if fmt == 'csv':
+        body = _iter_csv(frames)
+    elif fmt == 'json':
+        body = _iter_json(frames)
+    else:
+        try:
+            import pyarrow
+        except ImportError:
+            flask.abort(406, 'Arrow output requires pyarrow to be installed')
+        body = _iter_arrow(frames)
+
+    response = flask.Response(flask.stream_with_context(body), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'inline; filename={filename}.{fmt}'
+    return response
+
+
+def _iter_csv(frames):
+    header = True
+    for df in frames:
+        metrics.increment('export_api.rows', len(df))
+        yield df.to_csv(index=False, header=header, date_format='%Y-%m-%d')
+        header = False
+
+
+def _iter_json(frames):
+    yield '['
+    first = True
+    for df in frames:
+        if len(df) == 0:
+            continue
+        metrics.increment('export_api.rows', len(df))
+        records = df.to_json(orient='records', date_format='iso')[1:-1]
+        yield records if first else f',{records}'
+        first = False
+    yield ']'
+
+
+def _iter_arrow(frames):
+    import pyarrow as pa
+
+    class _Sink(io.RawIOBase):
+        def __init__(self):
+            self.chunks = list()
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            self.chunks.append(bytes(b))
+            return len(b)
+
+        def drain(self):
+            data = b''.join(self.chunks)
+            self.chunks = list()
+            return data
+
+    sink = _Sink()
+    writer = None
+    schema = None
+    for df in frames:
+        metrics.increment('export_api.rows', len(df))
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        if writer is None:
+            # The schema of the first chunk is used for the whole stream
+            schema = table.schema
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_table(table)
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+import functools
+import contextlib
+import collections
+
+
+class Metrics:
+    """
+    A thread safe registry of timers and counters for the data, analysis and page layers.
+
+    Timers are recorded under a stage name, e.g. 'treasury_api.send_request', and counters are free-form,
+    e.g. 'treasury_api.send_request.bytes'. A snapshot of everything recorded is served by the '/metrics'
+    endpoint of the Dash app.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = dict()
+        self._counters = collections.defaultdict(int)
+        self._started = datetime.datetime.now()
+
+    def record_time(self, name, seconds):
+        with self._lock:
+            if name not in self._timers:
+                self._timers[name] = {'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'last_s': 0.0}
+
+            timer = self._timers[name]
+            timer['count'] += 1
+            timer['total_s'] += seconds
+            timer['max_s'] = max(timer['max_s'], seconds)
+            timer['last_s'] = seconds
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_time(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """ Decorator version of timer() """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            timers = dict()
+            for name, timer in self._timers.items():
+                timers[name] = dict(timer)
+                timers[name]['mean_s'] = timer['total_s'] / timer['count']
+
+            return {'started': self._started.strftime('%Y-%m-%d %H:%M:%S'),
+                    'timers': timers,
+                    'counters': dict(self._counters)}
+
+    def reset(self):
+        with self._lock:
+            self._timers = dict()
+            self._counters = collections.defaultdict(int)
+            self._started = datetime.datetime.now()
+
+
+# Process wide registry used by all layers
+metrics = Metrics()
+
+
+def timed(name):
+    return metrics.timed(name)
+
+
+class StackSampler:
+    """
+    A minimal sampling profiler that collects stacks of all threads in the "folded" format used by
+    flamegraph.pl / speedscope, i.e. one 'frame;frame;frame count' line per unique stack.
+
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write_folded(self, filepath):
+        with open(filepath, 'w') as handle:
+            for stack, count in self._stacks.most_common():
+                handle.write(f'{stack} {count}\n')
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._stacks[self._fold(frame)] += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _fold(frame):
+        names = list()
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+@contextlib.contextmanager
+def profile_capture(output_folder, name='profile'):
+    """
+    Capture a cProfile (.prof) and a sampled flamegraph (.folded) of the enclosed block into output_folder.
+
+    If output_folder is None this is a no-op, so callers can wrap code unconditionally, e.g.:
+
+        with profile_capture(os.environ.get('MACRO_PROFILE_DIR')):
+            ...
+
+    """
+    if output_folder is None:
+        yield
+        return
+
+    os.makedirs(output_folder, exist_ok=True)
+    time_str = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    base_fp = os.path.join(output_folder, f'{name}_{time_str}')
+
+    profiler = cProfile.Profile()
+    sampler = StackSampler()
+
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+
+        profiler.dump_stats(f'{base_fp}.prof')
+        sampler.write_folded(f'{base_fp}.folded')
+
+        with open(f'{base_fp}.txt', 'w') as handle:
+            stats = pstats.Stats(profiler, stream=handle)
+            stats.sort_stats('cumulative').print_stats(50)
+
+        print(f'Profile written to {base_fp}.prof / .folded / .txt')
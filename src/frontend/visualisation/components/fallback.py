@@ -0,0 +1,54 @@
+import functools
+import threading
+
+from src.backend.instrumentation import metrics
+
+_build_state = threading.local()
+
+
+# A figure builder that fails (e.g. a source is down and nothing is cached) returns a placeholder figure instead of
+# failing the whole page
+def fallback_figure(name):
+    def decorator(build):
+        @functools.wraps(build)
+        def wrapper(*args, **kwargs):
+            try:
+                return build(*args, **kwargs)
+            except Exception as e:
+                print(f'Warning: Could not build {name}, showing a placeholder: {e!r}')
+                metrics.increment('page.figure_errors')
+                _build_state.degraded = True
+                return unavailable_figure()
+        return wrapper
+    return decorator
+
+
+def unavailable_figure():
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.add_annotation(text='Data is temporarily unavailable, please try again later',
+                       xref='paper', yref='paper', x=0.5, y=0.5, showarrow=False)
+    fig.update_xaxes(visible=False)
+    fig.update_yaxes(visible=False)
+    return fig
+
+
+# Like functools.lru_cache for a page layout(), except a layout with a placeholder figure is built again on the
+# next visit
+def cached_layout(build):
+    cache = dict()
+
+    @functools.wraps(build)
+    def layout():
+        if 'layout' in cache:
+            return cache['layout']
+
+        _build_state.degraded = False
+        result = build()
+        if not _build_state.degraded:
+            cache['layout'] = result
+        return result
+
+    layout.cache_clear = cache.clear
+    return layout
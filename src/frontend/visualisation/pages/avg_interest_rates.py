@@ -2,21 +2,24 @@ import datetime
 
 from dash import dcc
 from dash import html
-import plotly.graph_objects as go
-from src.backend.data.fiscaldata_treasury_gov.avg_interest_rates import AvgInterestRates
-
-from src.backend.data.home_treasury_gov.daily_treasury_yield_curve import DailyTreasuryYieldCurve
+from src.backend.instrumentation import timed
+from src.frontend.visualisation.components.fallback import cached_layout, fallback_figure
 
 start_date = datetime.datetime(year=2001, month=1, day=1)
 end_date = datetime.datetime.today()
-from src.backend.analysis.projected_interest import ProjectedInterest
 
 
+@fallback_figure('avg_interest_rates.plot_est_vs_actual')
+@timed('page.avg_interest_rates.plot_est_vs_actual')
 def plot_est_vs_actual():
+    import plotly.graph_objects as go
+    from src.backend.analysis.projected_interest_batch import ProjectedInterestBatch
+
+    batch = ProjectedInterestBatch(start_date=start_date, end_date=end_date)
+
     plot_list = list()
     for debt_type in ['T-Bills', 'T-Notes', 'T-Bonds']:
-        proj_interest = ProjectedInterest(debt_type=debt_type)
-        _plot_df = proj_interest.plot_est_vs_actual_interest()
+        _plot_df = batch.get_debt_type(debt_type)[['date', 'est_interest', 'month_expense_amt']]
 
         for col in _plot_df.columns.drop('date'):
             col_name = col.replace('_', ' ').title()
@@ -33,12 +36,21 @@ def plot_est_vs_actual():
     return fig
 
 
+@fallback_figure('avg_interest_rates.plot_avg_interest_rates')
+@timed('page.avg_interest_rates.plot_avg_interest_rates')
 def plot_avg_interest_rates():
+    import plotly.graph_objects as go
+    from src.backend.data.fiscaldata_treasury_gov.avg_interest_rates import AvgInterestRates
+    from src.backend.data.home_treasury_gov.daily_treasury_yield_curve import DailyTreasuryYieldCurve
+
     dtyc = DailyTreasuryYieldCurve()
     air = AvgInterestRates()
 
-    dtyc_df = dtyc.get_all_data_between_dates(start_date=start_date,
-                                              end_date=end_date)
+    list_of_maturity = ['1 Mo', '2 Mo', '3 Mo', '6 Mo', '1 Yr']
+
+    # Monthly mean yields, to compare with the monthly average interest rates
+    dtyc_df = dtyc.get_resampled_data(freq='monthly', agg='mean', start_date=start_date, end_date=end_date,
+                                      fields=list_of_maturity)
 
     security_desc_list = ['Treasury Bills']
     plot_list = list()
@@ -52,7 +64,6 @@ def plot_avg_interest_rates():
                                     line=dict(width=1),
                                     name=security_desc))
 
-    list_of_maturity = ['1 Mo', '2 Mo', '3 Mo', '6 Mo', '1 Yr']
     for maturity in list_of_maturity:
         plot_list.append(go.Scatter(x=dtyc_df['date'],
                                     y=dtyc_df[maturity],
@@ -66,18 +77,20 @@ def plot_avg_interest_rates():
     return fig
 
 
-# Define the page layout
-layout = html.Div(id='parent',
-                  children=[html.H1(id='H1',
-                                    children='Average Interest Rates',
-                                    style={'textAlign': 'center',
-                                           'marginTop': 40,
-                                           'marginBottom': 40,
-                                           'marginRight': 40,
-                                           'marginLeft': 40,
-                                           }),
-
-                            dcc.Graph(id="graph1", figure=plot_est_vs_actual()),
-                            dcc.Graph(id="graph2", figure=plot_avg_interest_rates()),
-                            ]
-                  )
+# Define the page layout, built on the first visit so the app starts without loading any data
+@cached_layout
+def layout():
+    return html.Div(id='parent',
+                    children=[html.H1(id='H1',
+                                      children='Average Interest Rates',
+                                      style={'textAlign': 'center',
+                                             'marginTop': 40,
+                                             'marginBottom': 40,
+                                             'marginRight': 40,
+                                             'marginLeft': 40,
+                                             }),
+
+                              dcc.Graph(id="graph1", figure=plot_est_vs_actual()),
+                              dcc.Graph(id="graph2", figure=plot_avg_interest_rates()),
+                              ]
+                    )
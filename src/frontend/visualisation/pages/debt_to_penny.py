@@ -2,11 +2,15 @@ import datetime
 
 from dash import dcc
 from dash import html
-import plotly.graph_objects as go
-from src.backend.data.fiscaldata_treasury_gov.debt_to_the_penny import DebtToThePenny
+from src.backend.instrumentation import timed
+from src.frontend.visualisation.components.fallback import cached_layout, fallback_figure
 
 
+@fallback_figure('debt_to_penny.plot_debt_to_penny')
+@timed('page.debt_to_penny.plot_debt_to_penny')
 def plot_debt_to_penny():
+    import plotly.graph_objects as go
+    from src.backend.data.fiscaldata_treasury_gov.debt_to_the_penny import DebtToThePenny
 
     start_date = datetime.datetime(year=1990, month=1, day=1)
     end_date = datetime.datetime.today()
@@ -30,18 +34,20 @@ def plot_debt_to_penny():
     return fig
 
 
-# Define the page layout
-layout = html.Div(id='parent',
-                  children=[html.H1(id='H1',
-                                    children='Debt To The Penny',
-                                    style={'textAlign': 'center',
-                                           'marginTop': 40,
-                                           'marginBottom': 40,
-                                           'marginRight': 40,
-                                           'marginLeft': 40,
-                                           }),
+# Define the page layout, built on the first visit so the app starts without loading any data
+@cached_layout
+def layout():
+    return html.Div(id='parent',
+                    children=[html.H1(id='H1',
+                                      children='Debt To The Penny',
+                                      style={'textAlign': 'center',
+                                             'marginTop': 40,
+                                             'marginBottom': 40,
+                                             'marginRight': 40,
+                                             'marginLeft': 40,
+                                             }),
 
-                            dcc.Graph(id='line_plot', figure=plot_debt_to_penny())
+                              dcc.Graph(id='line_plot', figure=plot_debt_to_penny())
 
-                            ]
-                  )
+                              ]
+                    )
@@ -7,3 +7,9 @@ def page_dict():
     _page_dict['/debt_to_penny'] = debt_to_penny
     _page_dict['/yield_curve'] = yield_curve
     return _page_dict
+
+
+def preload_pages(pages):
+    # Build every page layout (and load its data) up front rather than on the first visit
+    for page in pages.values():
+        page.layout()
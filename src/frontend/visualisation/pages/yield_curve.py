@@ -1,10 +1,43 @@
+import datetime
+import threading
+
 from dash import dcc
 from dash import html
-import plotly.graph_objects as go
-from src.backend.data.home_treasury_gov.daily_treasury_yield_curve import DailyTreasuryYieldCurve
+from dash import callback, Input, Output
+from src.backend.instrumentation import timed
+from src.frontend.visualisation.components.fallback import cached_layout, fallback_figure
+
+
+_yield_surface = {'surface': None, 'updated': None}
+_yield_surface_lock = threading.Lock()
+
+
+def get_yield_surface():
+    """ The yield surface, brought up to date on first use, on a new day and after refresh_yield_surface() """
+    from src.backend.data.home_treasury_gov.yield_surface import YieldSurface
+
+    with _yield_surface_lock:
+        if _yield_surface['surface'] is None:
+            _yield_surface['surface'] = YieldSurface()
 
+        if _yield_surface['updated'] != datetime.date.today():
+            _yield_surface['surface'].update()
+            _yield_surface['updated'] = datetime.date.today()
+        return _yield_surface['surface']
 
+
+def refresh_yield_surface():
+    # New yield curve data may have been downloaded or published, append it on the next use
+    with _yield_surface_lock:
+        _yield_surface['updated'] = None
+
+
+@fallback_figure('yield_curve.plot_yield_curve')
+@timed('page.yield_curve.plot_yield_curve')
 def plot_yield_curve():
+    import plotly.graph_objects as go
+    from src.backend.data.home_treasury_gov.daily_treasury_yield_curve import DailyTreasuryYieldCurve
+
     dtyc = DailyTreasuryYieldCurve()
 
     years = [2020, 2021, 2022]
@@ -34,18 +67,58 @@ def plot_yield_curve():
     return fig
 
 
-# Define the page layout
-layout = html.Div(id='parent',
-                  children=[html.H1(id='H1',
-                                    children='Yield Curve',
-                                    style={'textAlign': 'center',
-                                           'marginTop': 40,
-                                           'marginBottom': 40,
-                                           'marginRight': 40,
-                                           'marginLeft': 40,
-                                           }),
+@fallback_figure('yield_curve.plot_yield_surface')
+@timed('page.yield_curve.plot_yield_surface')
+def plot_yield_surface(start_date=None, end_date=None):
+    import plotly.graph_objects as go
+    from src.backend.data.constants import TENORS
+
+    yield_surface = get_yield_surface()
+    level = yield_surface.level_for_range(start_date=start_date, end_date=end_date)
+    dates, matrix = yield_surface.get_tile(level=level, start_date=start_date, end_date=end_date)
+
+    fig = go.Figure(go.Heatmap(x=dates,
+                               y=TENORS,
+                               z=matrix.T,
+                               colorscale='Viridis',
+                               colorbar=dict(title='Yield (%)')))
+
+    fig.update_layout(xaxis_title='Date',
+                      yaxis_title='Maturity',
+                      )
+    if start_date is not None and end_date is not None:
+        fig.update_xaxes(range=[start_date, end_date])
+
+    return fig
+
+
+@callback(Output('yield_surface', 'figure'),
+          Input('yield_surface', 'relayoutData'),
+          prevent_initial_call=True)
+def zoom_yield_surface(relayout_data):
+    # Re-render from the tile that matches the zoomed range, autorange (double click) returns to the full history
+    if relayout_data is None or 'xaxis.range[0]' not in relayout_data:
+        return plot_yield_surface()
+
+    return plot_yield_surface(start_date=relayout_data['xaxis.range[0]'][:10],
+                              end_date=relayout_data['xaxis.range[1]'][:10])
+
+
+# Define the page layout, built on the first visit so the app starts without loading any data
+@cached_layout
+def layout():
+    return html.Div(id='parent',
+                    children=[html.H1(id='H1',
+                                      children='Yield Curve',
+                                      style={'textAlign': 'center',
+                                             'marginTop': 40,
+                                             'marginBottom': 40,
+                                             'marginRight': 40,
+                                             'marginLeft': 40,
+                                             }),
 
-                            dcc.Graph(id='line_plot', figure=plot_yield_curve())
+                              dcc.Graph(id='line_plot', figure=plot_yield_curve()),
+                              dcc.Graph(id='yield_surface', figure=plot_yield_surface())
 
-                            ]
-                  )
+                              ]
+                    )
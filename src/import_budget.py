@@ -0,0 +1,87 @@
+import os
+import sys
+import argparse
+import subprocess
+
+"""
+Import time budget check for the serving path.
+
+Imports application.py in a fresh interpreter with -X importtime and fails (exit code 1) if the cumulative
+import time is over budget or if any module that should only be loaded lazily (plotting backends, pandas,
+analysis modules) is imported. tests/test_import_budget.py runs the same check.
+
+    python -m src.import_budget --budget-ms 1500
+
+"""
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_MS = float(os.environ.get('MACRO_IMPORT_BUDGET_MS', 1500))
+
+LAZY_MODULES = ['matplotlib', 'pandas', 'src.backend.analysis', 'src.backend.data.fiscaldata_treasury_gov',
+                'src.backend.data.home_treasury_gov']
+
+
+def measure_import_time(module='application'):
+    """ Return a list of (module, self_us, cumulative_us) for every module imported by `import module` """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT_FOLDER, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr}')
+
+    # Lines look like: 'import time:      1234 |      5678 |   package.module'
+    timings = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def get_lazy_imports(timings, lazy_modules=LAZY_MODULES):
+    """ The modules in timings that should only be loaded lazily """
+    return sorted({name for name, _, _ in timings
+                   for lazy in lazy_modules if name == lazy or name.startswith(f'{lazy}.')})
+
+
+def get_total_ms(timings, module='application'):
+    return sum(cumulative for name, _, cumulative in timings if name == module) / 1000
+
+
+def check_import_budget(budget_ms, module='application', lazy_modules=LAZY_MODULES, n_slowest=15):
+    timings = measure_import_time(module=module)
+
+    total_ms = get_total_ms(timings, module=module)
+    imported_lazy = get_lazy_imports(timings, lazy_modules=lazy_modules)
+
+    print(f'Import time for {module}: {total_ms:.0f} ms (budget {budget_ms:.0f} ms)')
+    print('Slowest imports (cumulative):')
+    top_level = [t for t in timings if '.' not in t[0] and t[0] != module]
+    for name, _, cumulative in sorted(top_level, key=lambda t: t[2], reverse=True)[:n_slowest]:
+        print(f'\t {cumulative / 1000:8.1f} ms  {name}')
+
+    passed = True
+    if total_ms > budget_ms:
+        print(f'FAIL: {module} import time is over budget')
+        passed = False
+
+    if len(imported_lazy) > 0:
+        print(f'FAIL: Modules that should be loaded lazily were imported: {", ".join(imported_lazy)}')
+        passed = False
+
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of the serving path')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--module', default='application')
+    args = parser.parse_args()
+
+    if not check_import_budget(budget_ms=args.budget_ms, module=args.module):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import socket
+import datetime
+import tempfile
+
+"""
+Fault injection scenarios for the fetch pipeline (see fetch_pipeline.py), run against the stand-in server.
+
+Each scenario injects faults into the stand-in and checks that the data layer and the pages degrade as intended:
+a failing year is skipped, the last good response is served when a source fails, the circuit breaker stops
+requests to a failing source and lets them through again once it recovers, older data is served while it is
+refreshed in the background (and views built from it catch up afterwards), slow responses are hedged and pages
+render a placeholder instead of failing. Exits with code 1 if any scenario fails, tests/test_fault_scenarios.py
+runs them under pytest.
+
+    python -m src.loadtest.fault_scenarios
+    python -m src.loadtest.fault_scenarios circuit_breaker hedging
+
+"""
+
+TODAY = datetime.datetime.combine(datetime.date.today(), datetime.time())
+
+SCENARIOS = ['partial_years', 'last_good_on_error', 'circuit_breaker', 'stale_while_revalidate',
+             'resample_after_revalidate', 'hedging', 'page_placeholder']
+
+
+class Scenarios:
+
+    def __init__(self, standin):
+        self.standin = standin
+
+        from src.backend.data.fetch_pipeline import get_fetch_pipeline, revalidator
+        from src.backend.data.fiscaldata_treasury_gov.avg_interest_rates import AvgInterestRates
+        from src.backend.data.fiscaldata_treasury_gov.debt_to_the_penny import DebtToThePenny
+        from src.backend.data.home_treasury_gov.daily_treasury_yield_curve import DailyTreasuryYieldCurve
+        from src.backend.instrumentation import metrics
+
+        self.metrics = metrics
+        self.revalidator = revalidator
+        self.avg_interest_rates = AvgInterestRates()
+        self.debt_to_penny = DebtToThePenny()
+        self.dtyc = DailyTreasuryYieldCurve()
+        self.pipeline = get_fetch_pipeline(self.dtyc.host)
+
+    def reset(self):
+        self.standin.clear_faults()
+        self.pipeline.breaker.record_success()
+        self.pipeline.hedge_after = 5.0
+        self.debt_to_penny._serve_stale = True
+
+    def partial_years(self):
+        """ A year of the yield curve that fails is skipped, the other years are returned """
+        self.standin.set_faults(fail_pattern='field_tdr_date_value=2021')
+        df = self.dtyc.get_all_data_between_dates(start_date=datetime.datetime(year=2020, month=1, day=1),
+                                                  end_date=datetime.datetime(year=2022, month=12, day=31))
+        years = sorted(int(year) for year in df['date'].dt.year.unique())
+        return years == [2020, 2022], f'years returned: {years}'
+
+    def last_good_on_error(self):
+        """ When the request for a new end date fails, the last good response for the same query is served """
+        self.debt_to_penny._serve_stale = False
+        start_date = datetime.datetime(year=2020, month=1, day=1)
+        before = self.debt_to_penny.get_all_data_between_dates(start_date=start_date,
+                                                               end_date=TODAY - datetime.timedelta(days=7))
+
+        self.standin.set_faults(error_rate=1.0)
+        after = self.debt_to_penny.get_all_data_between_dates(start_date=start_date, end_date=TODAY)
+        return after.equals(before), f'{len(before)} rows before the fault, {len(after)} rows served during it'
+
+    def circuit_breaker(self):
+        """ Repeated failures open the circuit (no more requests are sent), it closes again after a good trial """
+        self.debt_to_penny._serve_stale = False
+        self.standin.set_faults(error_rate=1.0)
+        breaker = self.pipeline.breaker
+
+        start_date = datetime.datetime(year=2021, month=1, day=1)
+        for days in range(breaker.failure_threshold):
+            self._try(lambda: self.debt_to_penny.get_all_data_between_dates(
+                start_date=start_date, end_date=TODAY - datetime.timedelta(days=days)))
+        opened = breaker.state == breaker.OPEN
+
+        n_requests = self.standin.n_requests
+        self._try(lambda: self.debt_to_penny.get_all_data_between_dates(start_date=start_date, end_date=TODAY))
+        rejected = self.standin.n_requests == n_requests
+
+        # Once the source recovers a trial request is let through after reset_timeout and closes the circuit
+        self.standin.clear_faults()
+        reset_timeout, breaker.reset_timeout = breaker.reset_timeout, 0.2
+        time.sleep(0.3)
+        self.debt_to_penny.get_all_data_between_dates(start_date=start_date, end_date=TODAY)
+        breaker.reset_timeout = reset_timeout
+        closed = breaker.state == breaker.CLOSED
+
+        return opened and rejected and closed, f'opened: {opened}, requests rejected: {rejected}, closed: {closed}'
+
+    def stale_while_revalidate(self):
+        """ Older data is served straight away while a slow source is requested in the background """
+        start_date = datetime.datetime(year=2019, month=1, day=1)
+        self.debt_to_penny.get_all_data_between_dates(start_date=start_date,
+                                                      end_date=TODAY - datetime.timedelta(days=7))
+
+        self.standin.set_faults(slow_rate=1.0, slow_seconds=2.0)
+        start = time.perf_counter()
+        self.debt_to_penny.get_all_data_between_dates(start_date=start_date, end_date=TODAY)
+        served_s = time.perf_counter() - start
+
+        self.revalidator.wait(timeout=30)
+        refreshed = self.debt_to_penny.is_cached(start_date=start_date, end_date=TODAY)
+        return served_s < 1.0 and refreshed, f'served in {served_s:.2f} s, refreshed in the background: {refreshed}'
+
+    def resample_after_revalidate(self):
+        """ A resampled view built from older cached data is updated once the background refresh has finished """
+        from src.backend.data.constants import DEFAULT_START_DATE
+
+        # Cache a response that ends more than a month ago, then serve it while the source is slow
+        for _ in self.avg_interest_rates.iter_data_between_dates(start_date=DEFAULT_START_DATE,
+                                                                 end_date=TODAY - datetime.timedelta(days=45)):
+            pass
+        self.standin.set_faults(slow_rate=1.0, slow_seconds=1.0)
+        before = self.avg_interest_rates.get_resampled_data(freq='monthly')['date'].max()
+
+        self.revalidator.wait(timeout=30)
+        self.standin.clear_faults()
+        after = self.avg_interest_rates.get_resampled_data(freq='monthly')['date'].max()
+        return before < after, f'last month before the refresh: {before:%Y-%m-%d}, after: {after:%Y-%m-%d}'
+
+    def hedging(self):
+        """ Requests still waiting after the hedge delay are sent again, so fewer requests are slow """
+        slow_rate, slow_seconds = 0.5, 1.5
+        self.standin.set_faults(slow_rate=slow_rate, slow_seconds=slow_seconds)
+        self.pipeline.hedge_after = 0.2
+        self.pipeline._latencies.clear()
+
+        hedged_before = self.metrics.snapshot()['counters'].get(f'fetch.{self.pipeline.source}.hedged', 0)
+        durations = list()
+        for year in range(2015, 2031):
+            start = time.perf_counter()
+            self.dtyc._request_csv(f'{year}/all?type=daily_treasury_yield_curve&field_tdr_date_value={year}')
+            durations.append(time.perf_counter() - start)
+        hedged = self.metrics.snapshot()['counters'].get(f'fetch.{self.pipeline.source}.hedged', 0) - hedged_before
+
+        slow_fraction = sum(d >= slow_seconds for d in durations) / len(durations)
+        return hedged > 0 and slow_fraction < slow_rate, f'{hedged} hedged, {slow_fraction:.0%} of requests slow'
+
+    def page_placeholder(self):
+        """ A page whose data cannot be loaded renders a placeholder, and is built again on the next visit """
+        from src.frontend.visualisation.pages import debt_to_penny
+
+        self.standin.set_faults(error_rate=1.0)
+        errors_before = self.metrics.snapshot()['counters'].get('page.figure_errors', 0)
+        debt_to_penny.layout()
+        debt_to_penny.layout()
+        errors = self.metrics.snapshot()['counters'].get('page.figure_errors', 0) - errors_before
+
+        self.reset()
+        debt_to_penny.layout()
+        n_requests = self.standin.n_requests
+        debt_to_penny.layout()
+        cached = self.standin.n_requests == n_requests
+
+        return errors == 2 and cached, f'placeholders rendered: {errors}, layout cached after recovery: {cached}'
+
+    # Internal Functions
+    @staticmethod
+    def _try(func):
+        try:
+            func()
+        except Exception:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run fault injection scenarios against the stand-in server')
+    parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default all): {", ".join(SCENARIOS)}')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if len(unknown) > 0:
+        parser.error(f'Unknown scenarios: {", ".join(unknown)}')
+
+    # The data layer reads its configuration when it is imported, so the environment must point at the stand-in
+    # before anything from src.backend is imported
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    cache_folder = tempfile.mkdtemp(prefix='macro_faults_')
+    os.environ.update(MACRO_FISCALDATA_URL=f'http://127.0.0.1:{port}/services/api/fiscal_service',
+                      MACRO_HOME_TREASURY_URL=f'http://127.0.0.1:{port}',
+                      MACRO_CACHE_FOLDER=os.path.join(cache_folder, ''))
+    os.environ.pop('MACRO_SHARED_STORE', None)
+
+    from src.loadtest.standin_server import StandInServer
+    from src.loadtest.synthetic_data import SyntheticTreasuryData
+
+    standin = StandInServer(SyntheticTreasuryData(start_year=2015), port=port).start()
+    scenarios = Scenarios(standin)
+    names = args.scenarios if len(args.scenarios) > 0 else SCENARIOS
+
+    results = list()
+    try:
+        for name in names:
+            scenarios.reset()
+            try:
+                passed, detail = getattr(scenarios, name)()
+            except Exception as e:
+                passed, detail = False, repr(e)
+            results.append((name, passed, detail))
+    finally:
+        standin.stop()
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+    print()
+    for name, passed, detail in results:
+        print(f'{"PASS" if passed else "FAIL"}  {name:<26} {detail}')
+
+    if not all(passed for _, passed, _ in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
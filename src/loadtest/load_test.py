@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from src.loadtest.standin_server import add_standin_arguments, make_server
+
+"""
+Load test for the Dash app against the synthetic Treasury stand-in.
+
+Starts the stand-in server and N app workers (each one application.py process with its own empty cache folder,
+or an existing deployment with --target), then drives concurrent page requests through the display_page
+callback, the same request the browser makes when navigating. Reports the latency percentiles per page, the
+throughput and the resident memory of every worker.
+
+    python -m src.loadtest.load_test --workers 4 --concurrency 16 --requests 2000 --tenors 20 --security-types 12
+    python -m src.loadtest.load_test --target http://127.0.0.1:8050 --pids 1234,1235
+
+"""
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGES = ['/avg_interest_rates', '/debt_to_penny', '/yield_curve']
+PERCENTILES = [50, 95, 99]
+
+WORKER_CMD = 'import application; application.server.run(host="127.0.0.1", port={port}, threaded=True)'
+
+
+def page_request_payload(pathname):
+    """ The body Dash posts to /_dash-update-component when the url pathname changes """
+    return {'output': 'page-content.children',
+            'outputs': {'id': 'page-content', 'property': 'children'},
+            'inputs': [{'id': 'url', 'property': 'pathname', 'value': pathname}],
+            'changedPropIds': ['url.pathname'],
+            'state': []}
+
+
+def get_memory(pid):
+    """ Current and peak resident memory (MB) of a process, read from /proc """
+    memory = dict()
+    try:
+        with open(f'/proc/{pid}/status') as handle:
+            for line in handle:
+                if line.startswith('VmRSS:'):
+                    memory['rss_mb'] = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    memory['peak_rss_mb'] = int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return memory
+
+
+class Worker:
+
+    def __init__(self, url, process=None, pid=None):
+        self.url = url
+        self.process = process
+        self.pid = process.pid if process is not None else pid
+
+    def wait_until_ready(self, timeout=120):
+        start = time.time()
+        while time.time() - start < timeout:
+            if self.process is not None and self.process.poll() is not None:
+                raise RuntimeError(f'Worker {self.url} exited with code {self.process.returncode}')
+            try:
+                requests.get(f'{self.url}/metrics', timeout=1)
+                return
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.2)
+        raise TimeoutError(f'Worker {self.url} did not start within {timeout} s')
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+
+class LoadTest:
+
+    def __init__(self, workers, pages=PAGES, concurrency=8, n_requests=500, timeout=300):
+        self.workers = workers
+        self.pages = pages
+        self.concurrency = concurrency
+        self.n_requests = n_requests
+        self.timeout = timeout
+
+        self._local = threading.local()
+
+    def run(self):
+        """ Warm every page on every worker (reported as cold), then run the timed requests """
+        cold = [self._request(worker, page) for worker in self.workers for page in self.pages]
+
+        jobs = [(self.workers[i % len(self.workers)], self.pages[i % len(self.pages)])
+                for i in range(self.n_requests)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(lambda job: self._request(*job), jobs))
+        duration = time.perf_counter() - start
+
+        return {'cold': self.summarise(cold),
+                'warm': self.summarise(results),
+                'warm_by_page': {page: self.summarise([r for r in results if r['page'] == page])
+                                 for page in self.pages},
+                'throughput_rps': len(results) / duration,
+                'duration_s': duration,
+                'memory': {worker.url: get_memory(worker.pid) for worker in self.workers if worker.pid is not None}}
+
+    @staticmethod
+    def summarise(results):
+        latencies = np.array([r['latency_s'] for r in results if r['ok']]) * 1000
+        summary = {'requests': len(results), 'errors': sum(not r['ok'] for r in results)}
+        if len(latencies) > 0:
+            for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+                summary[f'p{p}_ms'] = value
+            summary['max_ms'] = latencies.max()
+        return summary
+
+    # Internal Functions
+    def _request(self, worker, page):
+        # One session (keep-alive connection pool) per client thread
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+
+        start = time.perf_counter()
+        try:
+            response = self._local.session.post(f'{worker.url}/_dash-update-component',
+                                                json=page_request_payload(page), timeout=self.timeout)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return {'worker': worker.url, 'page': page, 'latency_s': time.perf_counter() - start, 'ok': ok}
+
+
+def start_workers(n_workers, base_port, env, cache_folder):
+    workers = list()
+    for i in range(n_workers):
+        port = base_port + i
+        # Every worker starts from its own empty cache so the first visits go through the stand-in
+        worker_env = dict(env, MACRO_CACHE_FOLDER=os.path.join(cache_folder, f'worker{i}', ''))
+        process = subprocess.Popen([sys.executable, '-c', WORKER_CMD.format(port=port)], cwd=ROOT_FOLDER,
+                                   env=worker_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        workers.append(Worker(url=f'http://127.0.0.1:{port}', process=process))
+
+    for worker in workers:
+        worker.wait_until_ready()
+    return workers
+
+
+def print_report(report):
+    def _row(name, summary):
+        values = '  '.join(f'{summary[f"p{p}_ms"]:9.1f}' if f'p{p}_ms' in summary else f'{"-":>9}'
+                           for p in PERCENTILES)
+        print(f'{name:<24} {summary["requests"]:>8} {summary["errors"]:>7}  {values}')
+
+    print(f'{"":<24} {"requests":>8} {"errors":>7}  ' + '  '.join(f'{f"p{p} (ms)":>9}' for p in PERCENTILES))
+    _row('cold (first visit)', report['cold'])
+    _row('warm', report['warm'])
+    for page, summary in report['warm_by_page'].items():
+        _row(f'  {page}', summary)
+
+    print(f'\nThroughput: {report["throughput_rps"]:.1f} requests/s over {report["duration_s"]:.1f} s')
+    for url, memory in report['memory'].items():
+        print(f'Memory {url}: {memory.get("rss_mb", 0):.0f} MB (peak {memory.get("peak_rss_mb", 0):.0f} MB)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Dash app against synthetic Treasury data')
+    parser.add_argument('--workers', type=int, default=2, help='Number of application.py processes to start')
+    parser.add_argument('--base-port', type=int, default=8070)
+    parser.add_argument('--standin-port', type=int, default=8060)
+    parser.add_argument('--target', default=None, help='Test a running app instead of starting workers')
+    parser.add_argument('--pids', default=None, help='Comma separated worker pids of --target, for memory')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--pages', default=','.join(PAGES))
+    parser.add_argument('--output', default=None, help='Also write the report as json')
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    if args.target is not None:
+        pids = [int(pid) for pid in args.pids.split(',')] if args.pids is not None else [None]
+        workers = [Worker(url=args.target.rstrip('/'), pid=pid) for pid in pids]
+        standin, cache_folder = None, None
+    else:
+        standin = make_server(args, port=args.standin_port).start()
+        print(f'Stand-in serving {standin.data.describe()}')
+
+        cache_folder = tempfile.mkdtemp(prefix='macro_loadtest_')
+        env = dict(os.environ, **standin.environment())
+        env.pop('MACRO_SHARED_STORE', None)
+        env.pop('MACRO_SNAPSHOT', None)
+        workers = start_workers(args.workers, base_port=args.base_port, env=env, cache_folder=cache_folder)
+
+    try:
+        load_test = LoadTest(workers, pages=args.pages.split(','), concurrency=args.concurrency,
+                             n_requests=args.requests)
+        report = load_test.run()
+    finally:
+        for worker in workers:
+            worker.stop()
+        if standin is not None:
+            standin.stop()
+        if cache_folder is not None:
+            shutil.rmtree(cache_folder, ignore_errors=True)
+
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import re
+import json
+import time
+import random
+import argparse
+import functools
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.loadtest.synthetic_data import SyntheticTreasuryData
+
+"""
+A local stand-in for the two Treasury hosts, serving SyntheticTreasuryData.
+
+    /services/api/fiscal_service/<endpoint>?fields=...&filter=...&sort=...&page[number]=1&page[size]=100
+    /resource-center/data-chart-center/interest-rates/daily-treasury-rates.csv/<year>/all?...
+    /resource-center/data-chart-center/interest-rates/daily-treasury-rates.csv/all/<YYYYMM>?...
+
+Point the app at it with the variables from environment():
+
+    MACRO_FISCALDATA_URL=http://127.0.0.1:8060/services/api/fiscal_service
+    MACRO_HOME_TREASURY_URL=http://127.0.0.1:8060
+
+    python -m src.loadtest.standin_server --port 8060 --start-year 1990 --tenors 20 --security-types 12
+
+Faults can be injected to test the fetch pipeline (see FAULTS), from the command line or at runtime by posting
+json to /_faults, e.g. fail every request for the 2021 yield curve and slow down a quarter of the rest:
+
+    python -m src.loadtest.standin_server --port 8060 --fail-pattern field_tdr_date_value=2021 \
+        --slow-rate 0.25 --slow-seconds 10
+    curl -X POST localhost:8060/_faults -d '{"error_rate": 1.0}'
+
+"""
+
+FISCALDATA_PATH = '/services/api/fiscal_service/'
+YIELD_CURVE_PATH = '/resource-center/data-chart-center/interest-rates/daily-treasury-rates.csv/'
+FAULTS_PATH = '/_faults'
+
+# error_rate:   fraction of requests answered with error_status
+# fail_pattern: regex, requests whose path (and query) matches are always answered with error_status
+# slow_rate:    fraction of requests delayed by slow_seconds (on top of the server's latency)
+FAULTS = {'error_rate': 0.0, 'error_status': 503, 'fail_pattern': None, 'slow_rate': 0.0, 'slow_seconds': 0.0}
+
+
+class StandInServer:
+
+    def __init__(self, data, host='127.0.0.1', port=8060, latency=0.0, faults=None, seed=0):
+        self.data = data
+        self.latency = latency
+        self.n_requests = 0
+        self.n_faults = 0
+        self.faults = dict(FAULTS)
+        self.set_faults(**(faults or dict()))
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._thread = None
+
+        # Encoded responses are kept, so the stand-in is not the bottleneck of a load test
+        self._fiscaldata_response = functools.lru_cache(maxsize=512)(self._encode_fiscaldata)
+        self._yield_curve_response = functools.lru_cache(maxsize=512)(self.data.yield_curve_csv)
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def environment(self):
+        """ Environment variables that point the data layer at this server """
+        return {'MACRO_FISCALDATA_URL': f'{self.url}{FISCALDATA_PATH[:-1]}',
+                'MACRO_HOME_TREASURY_URL': self.url}
+
+    def set_faults(self, **faults):
+        unknown = [key for key in faults if key not in FAULTS]
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown faults: {", ".join(unknown)}')
+        self.faults.update(faults)
+
+    def clear_faults(self):
+        self.faults = dict(FAULTS)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, path):
+        """ Return (status, content type, body) for a GET of path """
+        parsed = urllib.parse.urlsplit(path)
+        if parsed.path == FAULTS_PATH:
+            return 200, 'application/json', json.dumps(self.faults).encode()
+
+        with self._lock:
+            self.n_requests += 1
+            is_error = self._random.random() < self.faults['error_rate']
+            is_slow = self._random.random() < self.faults['slow_rate']
+
+        if self.faults['fail_pattern'] is not None and re.search(self.faults['fail_pattern'], path):
+            is_error = True
+
+        delay = self.latency + (self.faults['slow_seconds'] if is_slow else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if is_error:
+            with self._lock:
+                self.n_faults += 1
+            return self.faults['error_status'], 'application/json', json.dumps({'error': 'Injected fault'}).encode()
+
+        query = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+
+        try:
+            if parsed.path.startswith(FISCALDATA_PATH):
+                return 200, 'application/json', self._fiscaldata(parsed.path[len(FISCALDATA_PATH):], query)
+            if parsed.path.startswith(YIELD_CURVE_PATH):
+                return 200, 'text/csv', self._yield_curve(query)
+        except (KeyError, ValueError) as e:
+            return 400, 'application/json', json.dumps({'error': str(e)}).encode()
+        return 404, 'application/json', json.dumps({'error': f'Unknown path: {parsed.path}'}).encode()
+
+    # Internal Functions
+    def _fiscaldata(self, endpoint, query):
+        def _get(key, default):
+            return query[key][0].strip() if key in query else default
+
+        fields = tuple(f.strip() for f in _get('fields', '').split(',') if f.strip() != '')
+        # Filters are comma separated, except inside 'in' lists e.g. 'security_desc:in:(a,b)'
+        filters = tuple(f.strip() for f in re.split(r',(?![^(]*\))', _get('filter', '')) if f.strip() != '')
+        return self._fiscaldata_response(endpoint.strip('/'), fields, filters, _get('sort', '-record_date'),
+                                         int(_get('page[number]', 1)), int(_get('page[size]', 100)))
+
+    def _encode_fiscaldata(self, endpoint, fields, filters, sort, page_number, page_size):
+        payload = self.data.fiscaldata_payload(endpoint, fields=list(fields), filters=filters, sort=sort,
+                                               page_number=page_number, page_size=page_size)
+        return json.dumps(payload).encode()
+
+    def _yield_curve(self, query):
+        if 'field_tdr_date_value_month' in query:
+            return self._yield_curve_response(month=query['field_tdr_date_value_month'][0])
+        if 'field_tdr_date_value' in query:
+            return self._yield_curve_response(year=int(query['field_tdr_date_value'][0]))
+        raise ValueError('field_tdr_date_value or field_tdr_date_value_month is required')
+
+    def _make_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self._respond(*server.handle(self.path))
+
+            def do_POST(self):
+                if self.path != FAULTS_PATH:
+                    self._respond(404, 'application/json', b'{}')
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    server.set_faults(**json.loads(self.rfile.read(length) or b'{}'))
+                except ValueError as e:
+                    self._respond(400, 'application/json', json.dumps({'error': str(e)}).encode())
+                    return
+                self._respond(200, 'application/json', json.dumps(server.faults).encode())
+
+            def _respond(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return _Handler
+
+
+def add_standin_arguments(parser):
+    parser.add_argument('--start-year', type=int, default=1990)
+    parser.add_argument('--end-year', type=int, default=None)
+    parser.add_argument('--tenors', type=int, default=13, help='Number of yield curve tenors')
+    parser.add_argument('--security-types', type=int, default=None, help='Number of security types')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--fail-pattern', default=None, help='Regex of request paths that always fail')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Fraction of requests that are slow')
+    parser.add_argument('--slow-seconds', type=float, default=0.0)
+
+
+def make_server(args, port):
+    data = SyntheticTreasuryData(start_year=args.start_year, end_year=args.end_year, n_tenors=args.tenors,
+                                 n_security_types=args.security_types, seed=args.seed)
+    faults = {'error_rate': args.error_rate, 'error_status': args.error_status, 'fail_pattern': args.fail_pattern,
+              'slow_rate': args.slow_rate, 'slow_seconds': args.slow_seconds}
+    return StandInServer(data, port=port, latency=args.latency, faults=faults, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic Treasury data')
+    parser.add_argument('--port', type=int, default=8060)
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args, port=args.port)
+    print(f'Generated rows: {server.data.describe()}')
+    for key, value in server.environment().items():
+        print(f'{key}={value}')
+    server.httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+import io
+import math
+import zlib
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.backend.data.debt_column_matching import get_debt_matching_dict
+from src.backend.data.constants import TENORS
+
+"""
+Synthetic Fiscal Data and yield curve data for load testing.
+
+The generated data has the shape of the real sources (same endpoints, columns, dataTypes, record frequencies and
+CSV layout) at a configurable scale: the number of years, the number of yield curve tenors and the number of
+security types. The security types start with the real ones in get_debt_matching_dict(), so the average interest
+rate, interest expense and securities outstanding datasets line up the same way as the real ones do.
+
+Values are random walks from a fixed seed, so every request for the same range returns the same rows.
+
+"""
+
+DATE_FORMAT = '%Y-%m-%d'
+
+EXPENSE_CATG_DESC = 'INTEREST EXPENSE ON PUBLIC ISSUES'
+EXPENSE_GROUP_DESC = 'ACCRUED INTEREST EXPENSE'
+
+# Endpoint -> (record frequency, {column: Fiscal Data dataType})
+ENDPOINTS = {'v2/accounting/od/avg_interest_rates': ('monthly', {'record_date': 'DATE',
+                                                                 'security_type_desc': 'STRING',
+                                                                 'security_desc': 'STRING',
+                                                                 'avg_interest_rate_amt': 'PERCENTAGE',
+                                                                 'src_line_nbr': 'NUMBER'}),
+             'v2/accounting/od/debt_to_penny': ('daily', {'record_date': 'DATE',
+                                                          'debt_held_public_amt': 'CURRENCY',
+                                                          'intragov_hold_amt': 'CURRENCY',
+                                                          'tot_pub_debt_out_amt': 'CURRENCY',
+                                                          'src_line_nbr': 'NUMBER'}),
+             'v2/accounting/od/debt_outstanding': ('annual', {'record_date': 'DATE',
+                                                              'debt_outstanding_amt': 'CURRENCY',
+                                                              'src_line_nbr': 'NUMBER',
+                                                              'record_fiscal_year': 'NUMBER',
+                                                              'record_fiscal_quarter': 'NUMBER'}),
+             'v2/accounting/od/interest_expense': ('monthly', {'record_date': 'DATE',
+                                                               'expense_catg_desc': 'STRING',
+                                                               'expense_group_desc': 'STRING',
+                                                               'expense_type_desc': 'STRING',
+                                                               'month_expense_amt': 'CURRENCY',
+                                                               'fytd_expense_amt': 'CURRENCY'}),
+             'v1/debt/mspd/mspd_table_1': ('monthly', {'record_date': 'DATE',
+                                                       'security_type_desc': 'STRING',
+                                                       'security_class_desc': 'STRING',
+                                                       'debt_held_public_mil_amt': 'CURRENCY',
+                                                       'intragov_hold_mil_amt': 'CURRENCY',
+                                                       'total_mil_amt': 'CURRENCY'})}
+
+
+class SyntheticTreasuryData:
+
+    def __init__(self, start_year=1990, end_year=None, n_tenors=len(TENORS), n_security_types=None, seed=0):
+        self.start_year = start_year
+        self.end_year = datetime.datetime.today().year if end_year is None else end_year
+        self.seed = seed
+
+        self.tenors = self.make_tenors(n_tenors)
+        self.securities = self.make_securities(n_security_types)
+
+        self._lock = threading.Lock()
+        self._frames = dict()
+
+    @property
+    def end_date(self):
+        # The newest record is yesterday, or the end of end_year if that is in the past
+        yesterday = pd.Timestamp(datetime.datetime.today().date()) - pd.Timedelta(days=1)
+        return min(yesterday, pd.Timestamp(year=self.end_year, month=12, day=31))
+
+    @staticmethod
+    def make_tenors(n_tenors):
+        """ The real tenors, then longer synthetic ones ('40 Yr', '50 Yr', ...) """
+        tenors = list(TENORS[:n_tenors])
+        years = 40
+        while len(tenors) < n_tenors:
+            tenors.append(f'{years} Yr')
+            years += 10
+        return tenors
+
+    @staticmethod
+    def make_securities(n_security_types=None):
+        """ A list of (fiscaldata name, hometreasury name), the real types first then synthetic ones """
+        securities = [(names['fiscaldata'], names['hometreasury']) for names in get_debt_matching_dict().values()]
+        if n_security_types is None:
+            return securities
+
+        securities = securities[:n_security_types]
+        for i in range(len(securities), n_security_types):
+            securities.append((f'Synthetic Security {i + 1}', f'Synthetic Security {i + 1}'))
+        return securities
+
+    def describe(self):
+        """ Number of generated rows per endpoint and for the yield curve """
+        rows = {endpoint: len(self.get_frame(endpoint)) for endpoint in ENDPOINTS}
+        rows['daily_treasury_yield_curve'] = len(self.get_yield_curve()) * len(self.tenors)
+        return rows
+
+    # --- Fiscal Data
+    def fiscaldata_payload(self, endpoint, fields=None, filters=(), sort='-record_date', page_number=1,
+                           page_size=100):
+        """ A Fiscal Data style response: {'data': [...], 'meta': {...}, 'links': {...}} """
+        if endpoint not in ENDPOINTS:
+            raise KeyError(f'Unknown endpoint: {endpoint}')
+
+        _, data_types = ENDPOINTS[endpoint]
+        if fields is None or len(fields) == 0:
+            fields = list(data_types)
+        unknown = [f for f in fields if f not in data_types]
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown fields for {endpoint}: {", ".join(unknown)}')
+
+        df = self._apply_filters(self.get_frame(endpoint), filters)
+        df = df.sort_values(by=sort.lstrip('-'), ascending=not sort.startswith('-'), kind='stable')
+
+        total_count = len(df)
+        total_pages = math.ceil(total_count / page_size)
+        page = df.iloc[(page_number - 1) * page_size:page_number * page_size][fields]
+
+        meta = {'count': len(page),
+                'labels': {f: f for f in fields},
+                'dataTypes': {f: data_types[f] for f in fields},
+                'dataFormats': {f: 'YYYY-MM-DD' if data_types[f] == 'DATE' else 'String' for f in fields},
+                'total-count': total_count,
+                'total-pages': total_pages}
+        links = {'self': f'&page%5Bnumber%5D={page_number}&page%5Bsize%5D={page_size}',
+                 'first': f'&page%5Bnumber%5D=1&page%5Bsize%5D={page_size}',
+                 'prev': None,
+                 'next': None,
+                 'last': f'&page%5Bnumber%5D={max(total_pages, 1)}&page%5Bsize%5D={page_size}'}
+        return {'data': page.to_dict(orient='records'), 'meta': meta, 'links': links}
+
+    def get_frame(self, endpoint):
+        """ Every record of endpoint as strings, the way the API returns them """
+        with self._lock:
+            if endpoint not in self._frames:
+                self._frames[endpoint] = getattr(self, f'_make_{endpoint.split("/")[-1]}')()
+            return self._frames[endpoint]
+
+    # --- Yield curve
+    def yield_curve_csv(self, year=None, month=None):
+        """ The yield curve CSV for a year (e.g. 2020) or a month (e.g. '202210'), newest day first """
+        df = self.get_yield_curve()
+        if month is not None:
+            df = df[df['Date'].dt.strftime('%Y%m') == str(month)]
+        elif year is not None:
+            df = df[df['Date'].dt.year == int(year)]
+
+        df = df.sort_values(by='Date', ascending=False)
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, date_format='%m/%d/%Y', float_format='%.2f')
+        return buffer.getvalue().encode()
+
+    def get_yield_curve(self):
+        with self._lock:
+            if 'yield_curve' not in self._frames:
+                self._frames['yield_curve'] = self._make_yield_curve()
+            return self._frames['yield_curve']
+
+    # Internal Functions
+    def _rng(self, name):
+        return np.random.default_rng([self.seed, zlib.crc32(name.encode())])
+
+    def _dates(self, freq):
+        start = pd.Timestamp(year=self.start_year, month=1, day=1)
+        if freq == 'daily':
+            return pd.bdate_range(start, self.end_date)
+        if freq == 'monthly':
+            return pd.date_range(start, self.end_date, freq=pd.offsets.MonthEnd())
+        # Annual records are at the end of the fiscal year
+        fiscal_year_ends = [pd.Timestamp(year=y, month=9, day=30) for y in range(self.start_year, self.end_year + 1)]
+        return pd.DatetimeIndex([date for date in fiscal_year_ends if date <= self.end_date])
+
+    def _random_walk(self, name, n, start, step, low=None, reversion=0.0):
+        """ A random walk from start, with reversion > 0 it is pulled back towards start (e.g. for rates) """
+        steps = self._rng(name).normal(0, step, size=n)
+        if reversion > 0:
+            walk = np.empty(n)
+            value = start
+            for i in range(n):
+                value += reversion * (start - value) + steps[i]
+                walk[i] = value
+        else:
+            walk = start + np.cumsum(steps)
+        if low is not None:
+            walk = np.maximum(walk, low)
+        return walk
+
+    def _security_series(self):
+        """ Monthly rate (%) and amount outstanding per security, shared by the monthly endpoints """
+        dates = self._dates('monthly')
+        series = dict()
+        for i, (fiscal_name, _) in enumerate(self.securities):
+            rate = self._random_walk(f'rate.{fiscal_name}', len(dates), start=1 + i % 5, step=0.1, low=0.01,
+                                     reversion=0.02)
+            growth = np.exp(np.linspace(0, 2, len(dates)))
+            outstanding = (200e9 + 100e9 * i) * growth * (1 + self._rng(f'amt.{fiscal_name}').normal(0, 0.01,
+                                                                                                     len(dates)))
+            series[fiscal_name] = (rate, outstanding)
+        return dates, series
+
+    @staticmethod
+    def _format_dates(dates):
+        return np.asarray(dates.strftime(DATE_FORMAT))
+
+    @staticmethod
+    def _format_values(values, decimals=2):
+        return np.char.mod(f'%.{decimals}f', np.asarray(values, dtype=float))
+
+    def _make_avg_interest_rates(self):
+        dates, series = self._security_series()
+        frames = list()
+        for i, (fiscal_name, _) in enumerate(self.securities):
+            rate, _ = series[fiscal_name]
+            frames.append(pd.DataFrame({'record_date': self._format_dates(dates),
+                                        'security_type_desc': 'Marketable',
+                                        'security_desc': fiscal_name,
+                                        'avg_interest_rate_amt': self._format_values(rate, decimals=3),
+                                        'src_line_nbr': str(i + 1)}))
+        return pd.concat(frames, ignore_index=True)
+
+    def _make_debt_to_penny(self):
+        dates = self._dates('daily')
+        public = 2.5e12 * np.exp(np.linspace(0, 2.5, len(dates))) * (1 + self._rng('penny').normal(0, 0.001,
+                                                                                                     len(dates)))
+        intragov = 0.3 * public
+        return pd.DataFrame({'record_date': self._format_dates(dates),
+                             'debt_held_public_amt': self._format_values(public),
+                             'intragov_hold_amt': self._format_values(intragov),
+                             'tot_pub_debt_out_amt': self._format_values(public + intragov),
+                             'src_line_nbr': '1'})
+
+    def _make_debt_outstanding(self):
+        dates = self._dates('annual')
+        debt = 3e12 * np.exp(np.linspace(0, 2.3, len(dates)))
+        return pd.DataFrame({'record_date': self._format_dates(dates),
+                             'debt_outstanding_amt': self._format_values(debt),
+                             'src_line_nbr': '1',
+                             'record_fiscal_year': dates.year.astype(str),
+                             'record_fiscal_quarter': '4'})
+
+    def _make_interest_expense(self):
+        dates, series = self._security_series()
+        # The fiscal year starts in October
+        fiscal_years = np.where(dates.month >= 10, dates.year + 1, dates.year)
+
+        frames = list()
+        for fiscal_name, _ in self.securities:
+            rate, outstanding = series[fiscal_name]
+            noise = 1 + self._rng(f'expense.{fiscal_name}').normal(0, 0.05, len(dates))
+            month_expense = rate / 100 / 12 * outstanding * noise
+            fytd_expense = pd.Series(month_expense).groupby(fiscal_years).cumsum().to_numpy()
+            frames.append(pd.DataFrame({'record_date': self._format_dates(dates),
+                                        'expense_catg_desc': EXPENSE_CATG_DESC,
+                                        'expense_group_desc': EXPENSE_GROUP_DESC,
+                                        'expense_type_desc': fiscal_name,
+                                        'month_expense_amt': self._format_values(month_expense),
+                                        'fytd_expense_amt': self._format_values(fytd_expense)}))
+        return pd.concat(frames, ignore_index=True)
+
+    def _make_mspd_table_1(self):
+        dates, series = self._security_series()
+        frames = list()
+        for fiscal_name, home_name in self.securities:
+            _, outstanding = series[fiscal_name]
+            total_mil = outstanding / 1e6
+            frames.append(pd.DataFrame({'record_date': self._format_dates(dates),
+                                        'security_type_desc': 'Marketable',
+                                        'security_class_desc': home_name,
+                                        'debt_held_public_mil_amt': self._format_values(0.95 * total_mil),
+                                        'intragov_hold_mil_amt': self._format_values(0.05 * total_mil),
+                                        'total_mil_amt': self._format_values(total_mil)}))
+        return pd.concat(frames, ignore_index=True)
+
+    def _make_yield_curve(self):
+        dates = self._dates('daily')
+        short_rate = self._random_walk('yield.short', len(dates), start=3, step=0.05, low=0.01, reversion=0.002)
+        term_premium = self._random_walk('yield.premium', len(dates), start=1.5, step=0.03, reversion=0.002)
+
+        df = pd.DataFrame({'Date': dates})
+        max_days = max(self._tenor_days(t) for t in self.tenors)
+        for tenor in self.tenors:
+            weight = math.log1p(self._tenor_days(tenor)) / math.log1p(max_days)
+            noise = self._rng(f'yield.{tenor}').normal(0, 0.02, len(dates))
+            df[tenor] = np.maximum(short_rate + weight * term_premium + noise, 0)
+        return df
+
+    @staticmethod
+    def _tenor_days(tenor):
+        num, unit = tenor.split(' ')
+        return int(num) * (30 if unit == 'Mo' else 365)
+
+    @staticmethod
+    def _apply_filters(df, filters):
+        # Filters look like 'record_date:gte:2020-01-01', dates compare correctly as ISO strings
+        for _filter in filters:
+            field, operator, value = _filter.split(':', 2)
+            column = df[field]
+            if operator == 'eq':
+                df = df[column == value]
+            elif operator == 'in':
+                df = df[column.isin(value.strip('()').split(','))]
+            else:
+                df = df[{'lt': column < value, 'lte': column <= value,
+                         'gt': column > value, 'gte': column >= value}[operator]]
+        return df
+
+
+if __name__ == '__main__':
+    synthetic = SyntheticTreasuryData(start_year=1990, n_tenors=20, n_security_types=12)
+    print(synthetic.describe())
+
+    payload = synthetic.fiscaldata_payload('v2/accounting/od/avg_interest_rates',
+                                           fields=['record_date', 'security_desc', 'avg_interest_rate_amt'],
+                                           filters=['record_date:gte:2022-01-01'])
+    print(payload['meta'])
+    print(synthetic.yield_curve_csv(year=2022)[:300].decode())
@@ -0,0 +1,33 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from src.loadtest.fault_scenarios import SCENARIOS
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def results():
+    # The scenarios point the data layer at a stand-in server through the environment, so they run in their own
+    # interpreter rather than in the test process
+    result = subprocess.run([sys.executable, '-m', 'src.loadtest.fault_scenarios'], cwd=ROOT_FOLDER,
+                            capture_output=True, text=True, timeout=300)
+
+    # Result lines look like: 'PASS  partial_years            years returned: [2020, 2022]'
+    results = dict()
+    for line in result.stdout.splitlines():
+        status, _, rest = line.partition('  ')
+        if status in ['PASS', 'FAIL']:
+            name, _, detail = rest.strip().partition(' ')
+            results[name] = (status == 'PASS', detail.strip())
+    assert len(results) > 0, f'No scenario results:\n{result.stdout[-2000:]}\n{result.stderr[-2000:]}'
+    return results
+
+
+@pytest.mark.parametrize('name', SCENARIOS)
+def test_fault_scenario(results, name):
+    passed, detail = results[name]
+    assert passed, detail
@@ -0,0 +1,18 @@
+import pytest
+
+from src.import_budget import IMPORT_BUDGET_MS, get_lazy_imports, get_total_ms, measure_import_time
+
+
+@pytest.fixture(scope='module')
+def timings():
+    # `python -X importtime -c "import application"` in a fresh interpreter
+    return measure_import_time(module='application')
+
+
+def test_lazy_modules_are_not_imported(timings):
+    assert get_lazy_imports(timings) == []
+
+
+def test_import_time_is_within_budget(timings):
+    total_ms = get_total_ms(timings, module='application')
+    assert total_ms <= IMPORT_BUDGET_MS, f'Importing application took {total_ms:.0f} ms'
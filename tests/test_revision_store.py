@@ -0,0 +1,60 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from src.backend.data.revision_store import RevisionStore
+
+
+def _frame(rows):
+    return pd.DataFrame({'date': pd.to_datetime([date for date, _ in rows]), 'value': [value for _, value in rows]})
+
+
+def _as_of_rows(store):
+    df = store.as_of()
+    return sorted(zip(df['date'].dt.strftime('%Y-%m-%d'), df['value']))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RevisionStore('test', folder=str(tmp_path))
+
+
+def test_duplicate_rows_are_added_and_removed_one_at_a_time(store, tmp_path):
+    a, b = ('2020-01-02', 1.0), ('2020-01-03', 2.0)
+
+    store.record(_frame([a, b]), fetch_time=datetime.datetime(2020, 2, 1))
+    revision = store.record(_frame([a, a, b]), fetch_time=datetime.datetime(2020, 3, 1))
+    assert revision['changed_partitions'] == ['2020-01']
+    assert len(revision['added']) == 1
+    assert _as_of_rows(store) == sorted([a, a, b])
+
+    revision = store.record(_frame([a, b]), fetch_time=datetime.datetime(2020, 4, 1))
+    assert len(revision['added']) == 0 and len(revision['removed']) == 1
+    assert _as_of_rows(store) == sorted([a, b])
+    assert _as_of_rows(RevisionStore('test', folder=str(tmp_path))) == sorted([a, b])
+
+
+def test_as_of_rebuilds_earlier_refreshes(store):
+    a, b, c = ('2020-01-02', 1.0), ('2020-01-03', 2.0), ('2020-02-03', 3.0)
+    revised_b = ('2020-01-03', 2.5)
+
+    store.record(_frame([a, b]), fetch_time=datetime.datetime(2020, 2, 1))
+    store.record(_frame([a, revised_b, c]), fetch_time=datetime.datetime(2020, 3, 1))
+
+    assert _as_of_rows(store) == sorted([a, revised_b, c])
+    assert store.as_of(datetime.datetime(2020, 2, 15)).equals(_frame([a, b]))
+    assert store.revised_partitions() == ['2020-01']
+
+
+def test_a_range_refresh_keeps_partitions_outside_the_range(store):
+    a, b, c = ('2020-01-02', 1.0), ('2020-02-14', 2.0), ('2020-02-20', 3.0)
+
+    store.record(_frame([a, b, c]), fetch_time=datetime.datetime(2020, 3, 1))
+    # Covers part of February only, so b is not removed and nothing changed
+    revision = store.record(_frame([c]), fetch_time=datetime.datetime(2020, 4, 1),
+                            start_date=datetime.datetime(2020, 2, 15), end_date=datetime.datetime(2020, 2, 29))
+
+    assert revision is None
+    assert len(store.revisions()) == 1
+    assert _as_of_rows(store) == sorted([a, b, c])
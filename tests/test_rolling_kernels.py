@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.backend.analysis.rolling_kernels import (ChangeKernel, DrawdownKernel, InversionKernel, WindowKernel,
+                                                  YieldCurveAnalytics)
+
+WINDOW = 21
+CHUNK_SIZES = [1, 3, 7, 20, 21, 50, 230]
+
+
+@pytest.fixture(scope='module')
+def yields():
+    # Business days of random walk yields, with the 2 Yr moving above the 10 Yr (inverted) and back again
+    dates = pd.bdate_range('2000-01-03', periods=300)
+    rng = np.random.default_rng(0)
+    ten_year = 4 + np.cumsum(rng.normal(0, 0.05, len(dates)))
+    return pd.DataFrame({'date': dates,
+                         '3 Mo': ten_year - 1 + np.cumsum(rng.normal(0, 0.08, len(dates))),
+                         '2 Yr': ten_year - 0.3 * np.sin(np.arange(len(dates)) / 15) + rng.normal(0, 0.05, len(dates)),
+                         '10 Yr': ten_year})
+
+
+def _chunks(series, chunk_size):
+    return [series.iloc[i:i + chunk_size] for i in range(0, len(series), chunk_size)]
+
+
+def _run(kernel, series, chunk_size):
+    # Outputs are aligned on their dates by RollingAnalytics, so the kernels do not keep the names
+    return pd.concat([kernel.update(chunk) for chunk in _chunks(series, chunk_size)])
+
+
+def _inversion_days(series):
+    # Count of consecutive negative rows, recomputed over the full history
+    inverted = series < 0
+    runs = (~inverted).cumsum()
+    return inverted.astype(int).groupby(runs).cumsum()
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('func', ['mean', 'std', 'sum', 'min', 'max'])
+def test_window_kernel_matches_full_recompute(yields, chunk_size, func):
+    series = yields.set_index('date')['10 Yr']
+    expected = getattr(series.rolling(WINDOW), func)()
+    pd.testing.assert_series_equal(_run(WindowKernel(window=WINDOW, func=func), series, chunk_size), expected,
+                                   check_names=False, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('periods', [1, WINDOW])
+def test_change_kernel_matches_full_recompute(yields, chunk_size, periods):
+    series = yields.set_index('date')['10 Yr']
+    pd.testing.assert_series_equal(_run(ChangeKernel(periods=periods), series, chunk_size), series.diff(periods),
+                                   check_names=False)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_drawdown_kernel_matches_full_recompute(yields, chunk_size):
+    series = yields.set_index('date')['10 Yr']
+    pd.testing.assert_series_equal(_run(DrawdownKernel(), series, chunk_size), series / series.cummax() - 1,
+                                   check_names=False)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_inversion_kernel_matches_full_recompute(yields, chunk_size):
+    spread = yields.set_index('date').eval('`10 Yr` - `2 Yr`')
+    expected = _inversion_days(spread)
+
+    kernel = InversionKernel()
+    result = _run(kernel, spread, chunk_size)
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+    assert kernel.inverted_rows == int((spread < 0).sum())
+    assert kernel.episodes == int(((spread < 0) & ~(spread < 0).shift(fill_value=False)).sum())
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_yield_curve_analytics_appends_match_one_append(yields, chunk_size):
+    full = YieldCurveAnalytics(window=WINDOW)
+    full.append(yields)
+
+    incremental = YieldCurveAnalytics(window=WINDOW)
+    for i in range(0, len(yields), chunk_size):
+        incremental.append(yields.iloc[i:i + chunk_size])
+
+    assert full.inversion_2s10s.episodes > 0
+    pd.testing.assert_frame_equal(incremental.result, full.result, rtol=1e-12, atol=1e-12)
+    assert incremental.inversion_2s10s.episodes == full.inversion_2s10s.episodes